@@ -48,19 +48,65 @@ ergos. This software reads session yyyymmddhhmm.dat files and calculates
 athlete power output. The calculation is given below and relies upon flywheel
 mass (to weigh it, you will have to dismantle your machine - a bit :)
 
-Draws a graph of power, stroke rate etc
+Draws a graph of power, stroke rate etc, or summarises one or many sessions
+as text. The whole session view is drawn from cached levels of detail (see
+decimate.py) and only the span selected for the zoom at full resolution.
+Batch summaries are spread across every core and never load the plotting
+libraries.
 
   Usage:
-    analyse.py <dat/activitydate>.dat
+    analyse.py -i <activitydate> [-a|-c|-r|-p|-s]
+    analyse.py -i <activitydate> -t
+    analyse.py -b <directory or glob> [-o summary.csv]
 '''
 
-import matplotlib.pyplot as plt
-from matplotlib.gridspec import GridSpec
-from matplotlib.widgets import SpanSelector
-import numpy as np
-from postprocess import scan_data
+import os
+import sys
+import glob
+from postprocess import scan_arrays
+from cache import cached_scan
 import argparse
 
+def summary(power):
+    pwr_x, pwr_y = power
+
+    hours   = (pwr_x[-1] - pwr_x[0])/(60.*60.)
+    pwr_avg = sum(pwr_y)/len(pwr_y)
+
+    # duration, power, intensity, volume
+    return hours, pwr_avg, pwr_avg/hours, pwr_avg*hours
+
+def summarise(session, use_cache=True):
+    if use_cache:
+        energy, rpm, power, stroke, power_a, power_b = cached_scan(session)
+    else:
+        energy, rpm, power, stroke, power_a, power_b = scan_arrays(session)
+
+    # a session needs at least one full stroke to have a duration
+    if len(power[0]) < 2:
+        return None
+
+    return (os.path.basename(session).replace('.dat', ''),) + summary(power)
+
+def sessions(pattern):
+    # a directory means every session in it, sorted by datestamp
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*.dat')
+    return sorted(glob.glob(pattern), key=os.path.basename)
+
+def batch_summary(paths, use_cache=True, workers=None):
+    # one process per core, rows come back in the order of paths
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(workers) as pool:
+        rows = pool.map(summarise, paths, [use_cache]*len(paths))
+        return [row for row in rows if row is not None]
+
+def write_summary(rows, output):
+    output.write("Session, Duration h, Power W, Intensity W/h, Volume Wh\n")
+    for row in rows:
+        output.write("{}, {:.2f}, {:.1f}, {:.1f}, {:.1f}\n".format(*row))
+
 if __name__ == '__main__' :
 
     parser = argparse.ArgumentParser()
@@ -71,28 +117,62 @@ if __name__ == '__main__' :
     parser.add_argument("-p", '--power',   action="store_true", help="Show power")
     parser.add_argument("-s", '--stroke',  action="store_true", help="Show stroke rate")
     parser.add_argument("-t", '--text',    action="store_true", help="Show summary text")
+    parser.add_argument("-n", '--no-cache', action="store_true", help="Recalculate instead of using cached results")
+    parser.add_argument("-b", '--batch',   type=str, help="Summarise every session in a directory or glob")
+    parser.add_argument("-o", '--output',  type=str, help="Write the summary to a CSV file")
     args = parser.parse_args()
 
+    if args.batch or args.text:
+        if args.batch:
+            rows = batch_summary(sessions(args.batch), not args.no_cache)
+        else:
+            rows = [row for row in [summarise(args.input, not args.no_cache)] if row is not None]
+
+        if args.output:
+            with open(args.output, 'w') as output:
+                write_summary(rows, output)
+        else:
+            write_summary(rows, sys.stdout)
+
+        sys.exit(0)
+
+    # the plotting libraries are only needed from here on
+    import time
+    import numpy as np
+    import matplotlib.pyplot as plt
+    from matplotlib.gridspec import GridSpec
+    from matplotlib.widgets import SpanSelector
+    from matplotlib.patches import Rectangle
+    from matplotlib.transforms import Bbox, IdentityTransform
+
     SHOW_RPM    = False
     SHOW_POWER  = False
     SHOW_POWERA = False
     SHOW_POWERB = False
     SHOW_STROKE = False
-    SHOW_TEXT   = False
 
-    if args.text:
-        SHOW_TEXT = True
+    if (args.all or args.rpm) and not args.compact:
+        SHOW_RPM = True
+    if args.all or args.compact or args.power:
+        SHOW_POWER  = True
+        SHOW_POWERA = True
+        SHOW_POWERB = True
+    if args.all or args.compact or args.stroke:
+        SHOW_STROKE = True
+
+    from decimate import pyramid, level
+
+    # full resolution for the zoom, and levels of detail for the world view
+    if args.no_cache:
+        results  = scan_arrays(args.input)
+        pyramids = tuple(pyramid(x, y) for x, y in results)
     else:
-        if (args.all or args.rpm) and not args.compact:
-            SHOW_RPM = True
-        if args.all or args.compact or args.power:
-            SHOW_POWER  = True
-            SHOW_POWERA = True
-            SHOW_POWERB = True
-        if args.all or args.compact or args.stroke:
-            SHOW_STROKE = True
+        from cache import cached_pyramid
+        results  = cached_scan(args.input)
+        pyramids = cached_pyramid(args.input, results)
 
-    energy, rpm, power, stroke, power_a, power_b = scan_data(args.input)
+    energy, rpm, power, stroke, power_a, power_b = results
+    eny_lod, rpm_lod, pwr_lod, stk_lod, pwra_lod, pwrb_lod = pyramids
 
     rpm_color  = 'tab:green'
     eny_color  = 'tab:blue'
@@ -113,25 +193,29 @@ if __name__ == '__main__' :
     world_ax.set_ylabel('Flywheel Energy (joules)\nPower (watts)\nStroke Rate (dspm)', color=color)
     zoom_ax.set_ylabel('Flywheel Energy (joules)\nPower (watts))', color=color)
 
-    eny_x,  eny_y  = zip(*energy)
-    pwr_x , pwr_y  = zip(*power)
-    pwra_x, pwra_y = zip(*power_a)
-    pwrb_x, pwrb_y = zip(*power_b)
-    stk_x,  stk_y  = zip(*stroke)
+    # every series is a pair of NumPy arrays, x sorted, held once for the session
+    eny_x,  eny_y  = energy
+    pwr_x , pwr_y  = power
+    pwra_x, pwra_y = power_a
+    pwrb_x, pwrb_y = power_b
+    stk_x,  stk_y  = stroke
 
-    world_ax.plot(eny_x,  eny_y,  color=eny_color)
+    # the world view only needs a couple of points per pixel, peaks kept
+    world_points = int(2*world_ax.bbox.width)
+
+    world_ax.plot(*level(eny_lod, eny_x, eny_y, world_points), color=eny_color)
     zoom_eny,  = zoom_ax.plot([], [], color=eny_color)
 
     if SHOW_POWER:
-        world_ax.plot(pwra_x, pwra_y, color=pwra_color)
-        world_ax.plot(pwrb_x, pwrb_y, color=pwrb_color)
-        world_ax.plot(pwr_x,  pwr_y,  color=pwr_color)
+        world_ax.plot(*level(pwra_lod, pwra_x, pwra_y, world_points), color=pwra_color)
+        world_ax.plot(*level(pwrb_lod, pwrb_x, pwrb_y, world_points), color=pwrb_color)
+        world_ax.plot(*level(pwr_lod,  pwr_x,  pwr_y,  world_points), color=pwr_color)
         zoom_pwr,  = zoom_ax.plot([], [], color=pwr_color)
         zoom_pwra, = zoom_ax.plot([], [], color=pwra_color)
         zoom_pwrb, = zoom_ax.plot([], [], color=pwrb_color)
 
     if SHOW_STROKE:
-        world_ax.plot(stk_x,  stk_y,  color=stk_color)
+        world_ax.plot(*level(stk_lod, stk_x, stk_y, world_points), color=stk_color)
 
     eny_scat  = zoom_ax.scatter([], [], color=eny_color,  marker='.')
 
@@ -147,95 +231,122 @@ if __name__ == '__main__' :
 
     anno.set_visible(False)
 
-    def hover(event):
-
-        if event.inaxes == zoom_ax:
-            e_valid, e_index = eny_scat.contains(event)
-            a_valid = False
-            b_valid = False
+    # hover looks points up by time in the series shown in the zoom, which
+    # are sorted by time already. Only the few within HOVER_RADIUS pixels
+    # either side of the mouse are hit tested, and mouse moves are handled
+    # at most every HOVER_INTERVAL seconds.
+    HOVER_RADIUS   = 5      # pixels
+    HOVER_INTERVAL = 1./30.
 
-            if SHOW_POWER:
-                a_valid, a_index = pwra_scat.contains(event)
-                b_valid, b_index = pwrb_scat.contains(event)
-
-            anno.set_visible(a_valid or b_valid or e_valid)
-
-            if SHOW_POWER and a_valid:
-                pos = pwra_scat.get_offsets()[a_index["ind"][0]]
-                anno.xy = pos
-                anno.set_text("Stroke Power {:.0f}W\nTime {:.3f}s".format(pos[1], pos[0]))
-                fig.canvas.draw_idle()
-            elif SHOW_POWER and b_valid:
-                pos = pwrb_scat.get_offsets()[b_index["ind"][0]]
-                anno.xy = pos
-                anno.set_text("Stroke Power {:.0f}W\nTime {:.3f}s".format(pos[1], pos[0]))
-                fig.canvas.draw_idle()
-            elif e_valid:
-                pos = eny_scat.get_offsets()[e_index["ind"][0]]
-                anno.xy = pos
-                anno.set_text("Flywheel Energy {:.0f}J\nTime {:.3f}s".format(pos[1], pos[0]))
-                fig.canvas.draw_idle()
+    hover_index = {'series': []}    # (x, y, label) in zoom, highest priority first
+    hover_last  = {'time': 0.0}
 
-    def spanselect(xmin, xmax):
+    def nearest(x, y, ex, ey):
+        # index of the point nearest display position ex, ey if within the radius
+        x0, x1 = zoom_ax.transData.inverted().transform([(ex - HOVER_RADIUS, ey), (ex + HOVER_RADIUS, ey)])[:, 0]
+        lo, hi = np.searchsorted(x, (x0, x1), side='right')
+        if lo == hi:
+            return None
 
-        indmin, indmax = np.searchsorted(eny_x, (xmin, xmax))
-        indmax = min(len(eny_x) - 1, indmax)
+        near = zoom_ax.transData.transform(np.column_stack((x[lo:hi], y[lo:hi])))
+        dist = np.hypot(near[:, 0] - ex, near[:, 1] - ey)
+        i    = dist.argmin()
+        return lo + i if dist[i] <= HOVER_RADIUS else None
 
-        eny_region_x = eny_x[indmin:indmax]
-        eny_region_y = eny_y[indmin:indmax]
+    def hover(event):
 
-        indmin, indmax = np.searchsorted(pwr_x, (xmin, xmax))
-        indmax = min(len(eny_x) - 1, indmax)
+        if event.inaxes == zoom_ax:
+            now = time.monotonic()
+            if now - hover_last['time'] < HOVER_INTERVAL:
+                return
+            hover_last['time'] = now
+
+            text = None
+            for x, y, label in hover_index['series']:
+                i = nearest(x, y, event.x, event.y)
+                if i is not None:
+                    anno.xy = (x[i], y[i])
+                    text    = label.format(y[i], x[i])
+                    break
+
+            # only redraw when the tooltip changes
+            if (text is not None) != anno.get_visible() or (text is not None and text != anno.get_text()):
+                anno.set_visible(text is not None)
+                if text is not None:
+                    anno.set_text(text)
+                redraw_zoom()
+
+    def region(x, y, xmin, xmax):
+        # the samples between xmin and xmax, as views on the full series
+        lo, hi = np.searchsorted(x, (xmin, xmax), side='right')
+        return x[lo:hi], y[lo:hi]
+
+    # the zoom axes are redrawn on their own while the span is dragged: the
+    # strip of the figure they occupy is painted over and blitted, leaving
+    # the world view alone. The strip is found whenever the figure is drawn.
+    zoom_band  = {'bbox': None}
+    zoom_patch = Rectangle((0, 0), 0, 0, transform=IdentityTransform(),
+                           facecolor=fig.get_facecolor(), edgecolor='none', animated=True)
+    fig.add_artist(zoom_patch)
+
+    def find_zoom_band(event):
+        renderer = event.renderer
+        top      = world_ax.get_tightbbox(renderer).y0
+        bottom   = rpm_ax.get_tightbbox(renderer).y1 if SHOW_RPM else fig.bbox.y0
+        zoom_band['bbox'] = Bbox.from_extents(fig.bbox.x0, bottom, fig.bbox.x1, top)
+        zoom_patch.set_bounds(fig.bbox.x0, bottom, fig.bbox.width, top - bottom)
+
+    def redraw_zoom():
+        if zoom_band['bbox'] is None or not fig.canvas.supports_blit:
+            fig.canvas.draw_idle()
+            return
+        fig.draw_artist(zoom_patch)
+        fig.draw_artist(zoom_ax)
+        fig.canvas.blit(zoom_band['bbox'])
 
-        pwr_region_x = pwr_x[indmin:indmax]
-        pwr_region_y = pwr_y[indmin:indmax]
+    def spanselect(xmin, xmax):
 
-        zoom_seconds = (pwr_region_x[-1] - pwr_region_x[0])
-        zoom_pwr_avg = sum(pwr_region_y)/len(pwr_region_y)
+        eny_region_x, eny_region_y = region(eny_x, eny_y, xmin, xmax)
+        pwr_region_x, pwr_region_y = region(pwr_x, pwr_y, xmin, xmax)
 
-        zoom_ax.set_xlabel("Duration: {:.1f}s, Power: {:.1f}W".format(
-                            zoom_seconds,
-                            zoom_pwr_avg))
+        if len(pwr_region_x) > 1:
+            zoom_ax.set_xlabel("Duration: {:.1f}s, Power: {:.1f}W".format(
+                                pwr_region_x[-1] - pwr_region_x[0],
+                                pwr_region_y.mean()))
         if SHOW_POWER:
-            indmin, indmax = np.searchsorted(pwra_x, (xmin, xmax))
-            indmax = min(len(eny_x) - 1, indmax)
-
-            pwra_region_x = pwra_x[indmin:indmax]
-            pwra_region_y = pwra_y[indmin:indmax]
-
-            indmin, indmax = np.searchsorted(pwrb_x, (xmin, xmax))
-            indmax = min(len(eny_x) - 1, indmax)
-
-            pwrb_region_x = pwrb_x[indmin:indmax]
-            pwrb_region_y = pwrb_y[indmin:indmax]
+            pwra_region_x, pwra_region_y = region(pwra_x, pwra_y, xmin, xmax)
+            pwrb_region_x, pwrb_region_y = region(pwrb_x, pwrb_y, xmin, xmax)
 
         if len(eny_region_x) > 1:
             zoom_eny.set_data(eny_region_x, eny_region_y)
+            eny_scat.set_offsets(np.column_stack((eny_region_x, eny_region_y)))
 
-            eny_temp  = zoom_ax.scatter(eny_region_x, eny_region_y)
-            eny_scat.set_offsets(eny_temp.get_offsets())
-
-            if len(pwr_region_x) > 1:
+            if SHOW_POWER:
                 zoom_pwr.set_data(pwr_region_x, pwr_region_y)
-
-            if SHOW_POWER and len(pwra_region_x) > 1 and len(pwrb_region_x) > 1:
                 zoom_pwra.set_data(pwra_region_x, pwra_region_y)
                 zoom_pwrb.set_data(pwrb_region_x, pwrb_region_y)
 
-                pwra_temp = zoom_ax.scatter(pwra_region_x, pwra_region_y)
-                pwrb_temp = zoom_ax.scatter(pwrb_region_x, pwrb_region_y)
+                pwra_scat.set_offsets(np.column_stack((pwra_region_x, pwra_region_y)))
+                pwrb_scat.set_offsets(np.column_stack((pwrb_region_x, pwrb_region_y)))
 
-                pwra_scat.set_offsets(pwra_temp.get_offsets())
-                pwrb_scat.set_offsets(pwrb_temp.get_offsets())
+            # what hover looks up, rebuilt with each zoom
+            series = []
+            if SHOW_POWER:
+                series.append((pwra_region_x, pwra_region_y, "Stroke Power {:.0f}W\nTime {:.3f}s"))
+                series.append((pwrb_region_x, pwrb_region_y, "Stroke Power {:.0f}W\nTime {:.3f}s"))
+            series.append((eny_region_x, eny_region_y, "Flywheel Energy {:.0f}J\nTime {:.3f}s"))
+            hover_index['series'] = series
+            anno.set_visible(False)
 
             zoom_ax.set_xlim(eny_region_x[0], eny_region_x[-1])
-            zoom_ax.set_ylim(0, (((max(eny_region_y)/50)+1)*50))
-            fig.canvas.draw_idle()
+            zoom_ax.set_ylim(0, (((eny_region_y.max()/50)+1)*50))
+            redraw_zoom()
 
     span = SpanSelector(
         world_ax,
         spanselect,
         "horizontal",
+        onmove_callback=spanselect,
         useblit=True,
         props=dict(alpha=0.5, facecolor="tab:blue"),
         interactive=True,
@@ -245,33 +356,18 @@ if __name__ == '__main__' :
     if SHOW_RPM:
         rpm_ax.grid(visible=True)
         rpm_ax.set_ylabel('Flywheel\n(rpm)', color=rpm_color)
-        rpm_x, rpm_y = zip(*rpm)
+        rpm_x, rpm_y = level(rpm_lod, rpm[0], rpm[1], world_points)
         rpm_ax.plot(rpm_x, rpm_y, color=rpm_color)
         rpm_scat = rpm_ax.scatter(rpm_x, rpm_y, color=rpm_color, marker='.')
 
-    summary_hours = (pwr_x[-1] - pwr_x[0])/(60.*60.)
-    summary_pwr_avg = sum(pwr_y)/len(pwr_y)
-
     world_ax.set_title('Session: {}'.format(args.input))
-    world_ax.set_xlabel("Duration: {:.2f}h, Power: {:.1f}W, Intensity: {:.1f}W/h, Volume: {:.1f}Wh".format(
-                        summary_hours,
-                        summary_pwr_avg,
-                        summary_pwr_avg/summary_hours,
-                        summary_pwr_avg*summary_hours))
+    world_ax.set_xlabel("Duration: {:.2f}h, Power: {:.1f}W, Intensity: {:.1f}W/h, Volume: {:.1f}Wh".format(*summary(power)))
 
     zoom_ax.set_xlabel('Time (seconds)')
 
     fig.canvas.mpl_connect("motion_notify_event", hover)
+    fig.canvas.mpl_connect("draw_event", find_zoom_band)
 
     plt.tight_layout()
 
-    if SHOW_TEXT:
-        print("Session, Duration h, Power W, Intensity W/h, Volume Wh")
-        print("{}, {:.2f}, {:.1f}, {:.1f}, {:.1f}".format(
-                        args.input,
-                        summary_hours,
-                        summary_pwr_avg,
-                        summary_pwr_avg/summary_hours,
-                        summary_pwr_avg*summary_hours))
-    else:
-        plt.show()
+    plt.show()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+'''
+// ---------------------------------------------------------------------------
+//
+//                                      ,`\
+//  L                              ...    /  M   M             k
+//  L      ooo   ggg  i  ccc     @ o o @.'   M\ /M  ooo  n nn  k k   ee  y   y
+//  L     o   o g   g . c      .' ( o )      M V M o   o n'  n kk   e__e y   y
+//  L     o   o g   g i c     /  (     )     M   M o   o n   n k k  e    y   y
+//  LLLLL  ooo   gggg i  ccc  \.' \ : /      M   M  ooo  n   n K  k  ee'  yyyy
+//                  g            nnn nnn                                    y
+//                gg                                                     yyy
+//
+// ------------------------------------------------------=--------------------
+//
+// Piyak - a program to monitor and log the effort on a kayak ergo.
+//
+// Copyright (c) 2017-24 Piers Barber   piers.barber@logicmonkey.co.uk
+//
+// ------------------------------------------------------=--------------------
+
+This is free software released under the terms of the MIT licence
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+'''
+Capture Benchmark
+
+How fast can the capture path take flywheel edges? fake_pigpio drives
+gpio_pin with a steady edge rate on its own thread, as the pigpio callback
+thread would, while the main thread drains the pin at 60Hz into preallocated
+buffers and writes the periods to a dat file as the live session does. Each rate runs for a few
+seconds and reports the edge rate actually achieved, the most periods
+drained in one update and any dropped. The tick starts just short of the
+32 bit wrap so every run crosses it, and every period drained is checked.
+
+A flywheel at 1200rpm is only 20 edges/s, so anything short of thousands
+of edges/s is a problem. The flat out figure is the callback path alone,
+stepped with no other thread running: its ceiling on this machine.
+
+  Usage:
+    bench_capture.py [-t seconds] [rates ...]
+'''
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from array import array
+from datetime import datetime
+
+import fake_pigpio
+from gpio_pin import gpio_pin
+from datfile import session_writer
+from strokes import MASS, RADIUS
+
+RATES = [1000, 10000, 25000, 50000, 100000]     # edges/s
+WRAP  = (1 << 32) - 1000000                     # a second short of the tick wrapping
+
+def capture(rate, seconds, path):
+    period = int(round(1e6/rate))
+    device = fake_pigpio.pi(fake_pigpio.steady(period), start_tick=WRAP)
+    pin    = gpio_pin(device, 2, queue_size=65536)
+    dat    = session_writer(path, datetime.now(), MASS, RADIUS)
+
+    # drained into arrays allocated once, as the live session does
+    ticks   = array('L', [0]) * 65536
+    buffer  = array('L', [0]) * 65536
+
+    drained = 0
+    most    = 0
+    wrong   = 0
+
+    start = time.perf_counter()
+    device.start()
+    while time.perf_counter() - start < seconds:
+        time.sleep(1./60.)
+        count   = pin.drain_into(ticks, buffer)
+        periods = memoryview(buffer)[:count]
+        dat.write_periods(periods)
+        drained += len(periods)
+        most     = max(most, len(periods))
+        wrong   += sum(1 for p in periods if p != period)
+    device.stop()
+    elapsed = time.perf_counter() - start
+
+    count    = pin.drain_into(ticks, buffer)
+    periods  = memoryview(buffer)[:count]
+    dat.write_periods(periods)
+    drained += len(periods)
+    wrong   += sum(1 for p in periods if p != period)
+    pin.cancel()
+    dat.close()
+
+    return device.edges/elapsed, drained, most, pin.dropped, wrong
+
+def flat_out(edges):
+    # the callback path alone, stepped in this thread
+    device = fake_pigpio.pi(fake_pigpio.steady(50, edges), start_tick=WRAP)
+    pin    = gpio_pin(device, 2, queue_size=edges + 1)
+
+    start = time.perf_counter()
+    device.advance(WRAP + 50*edges)
+    elapsed = time.perf_counter() - start
+    pin.cancel()
+
+    return edges/elapsed
+
+if __name__ == '__main__' :
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("rates", nargs='*', type=int, default=RATES, help="Edge rates to try, edges/s")
+    parser.add_argument("-t", '--time', type=float, default=3.0, help="Seconds at each rate")
+    args = parser.parse_args()
+
+    print("flat out {:10.0f} edges/s".format(flat_out(200000)))
+
+    tmp = tempfile.mkdtemp()
+    failed = 0
+    for rate in args.rates:
+        path = os.path.join(tmp, '{}.dat'.format(rate))
+        achieved, drained, most, dropped, wrong = capture(rate, args.time, path)
+        os.remove(path)
+
+        ok = not dropped and not wrong and achieved > 0.95*rate
+        failed += not ok
+        print("{:8d} edges/s  achieved {:8.0f}  drained {:8d}  {:5d} max per update  {} dropped  {} wrong  {}".format(
+              rate, achieved, drained, most, dropped, wrong, 'ok' if ok else 'LIMIT'))
+    os.rmdir(tmp)
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+'''
+// ---------------------------------------------------------------------------
+//
+//                                      ,`\
+//  L                              ...    /  M   M             k
+//  L      ooo   ggg  i  ccc     @ o o @.'   M\ /M  ooo  n nn  k k   ee  y   y
+//  L     o   o g   g . c      .' ( o )      M V M o   o n'  n kk   e__e y   y
+//  L     o   o g   g i c     /  (     )     M   M o   o n   n k k  e    y   y
+//  LLLLL  ooo   gggg i  ccc  \.' \ : /      M   M  ooo  n   n K  k  ee'  yyyy
+//                  g            nnn nnn                                    y
+//                gg                                                     yyy
+//
+// ------------------------------------------------------=--------------------
+//
+// Piyak - a program to monitor and log the effort on a kayak ergo.
+//
+// Copyright (c) 2017-24 Piers Barber   piers.barber@logicmonkey.co.uk
+//
+// ------------------------------------------------------=--------------------
+
+This is free software released under the terms of the MIT licence
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+'''
+Startup Benchmark
+
+Measures how long the main modules take to import in a fresh interpreter
+and how long the app takes to put its first frame on the screen, both as
+piyak.py on the flywheel sensor and as piyak-demo.py on a fake one, then
+compares them against the budget recorded in startup_budget.json. Exits
+non-zero if anything is over budget so it can gate a change.
+
+Anything that cannot run on this machine (no kivy, no pigpio daemon, no
+display) is reported as skipped rather than failed. Record a new budget on
+the target machine, the Pi 3 on the ergo, with --record: the median of the
+runs is kept as measured alongside the budget, with the machine, Python
+and date they were measured on. The budget is HEADROOM times the median
+plus SLACK seconds, as a fresh interpreter's start varies by a few tens of
+milliseconds from run to run however small the import. Nothing is budgeted
+that wasn't measured, and a budget from another machine is still checked
+but flagged as not comparable.
+
+  Usage:
+    bench_startup.py [-n runs] [--record]
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+from datetime import date
+
+BUDGET   = 'startup_budget.json'
+MODULES  = ('postprocess', 'analyse', 'piyak')
+HEADROOM = 1.5
+SLACK    = 0.05   # seconds
+
+def machine():
+    # the Pi's model, or the processor of anything else
+    try:
+        with open('/proc/device-tree/model') as model:
+            return model.read().strip('\0\n')
+    except OSError:
+        pass
+    try:
+        with open('/proc/cpuinfo') as cpuinfo:
+            for line in cpuinfo:
+                if line.startswith('model name'):
+                    return '{} {}'.format(platform.machine(), line.split(':', 1)[1].strip())
+    except OSError:
+        pass
+    return platform.machine() or 'unknown'
+
+def import_time(module, runs):
+    code = "import time; t = time.perf_counter(); import {}; print(time.perf_counter() - t)".format(module)
+
+    times = []
+    for run in range(runs):
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+        if result.returncode != 0:
+            return None
+        times.append(float(result.stdout.split()[-1]))
+
+    return statistics.median(times)
+
+def first_frame(script, runs):
+    env = dict(os.environ, PIYAK_FIRST_FRAME='1')
+
+    times = []
+    for run in range(runs):
+        start = time.time()
+        try:
+            result = subprocess.run([sys.executable, script], env=env, capture_output=True, text=True, timeout=120)
+        except subprocess.TimeoutExpired:
+            return None
+
+        frames = [line.split()[1] for line in result.stdout.splitlines() if line.startswith('PIYAK_FIRST_FRAME')]
+        if not frames:
+            return None
+        times.append(float(frames[0]) - start)
+
+    return statistics.median(times)
+
+if __name__ == '__main__' :
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", '--runs',  type=int, default=5, help="Runs per measurement (median is used)")
+    parser.add_argument("-r", '--record', action="store_true", help="Record the measurements as the new budget")
+    args = parser.parse_args()
+
+    # modules and data files are found relative to the piyak directory
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    measured = {'import ' + module: import_time(module, args.runs) for module in MODULES}
+    measured['first frame']      = first_frame('piyak.py', args.runs)
+    measured['first frame demo'] = first_frame('piyak-demo.py', args.runs)
+
+    if args.record:
+        record = {'machine':  machine(),
+                  'python':   platform.python_version(),
+                  'date':     date.today().isoformat(),
+                  'method':   'bench_startup.py --record, median of {} runs each in a fresh interpreter'.format(args.runs),
+                  'headroom': HEADROOM,
+                  'slack':    SLACK,
+                  'measured': {name: round(seconds, 3) for name, seconds in measured.items() if seconds is not None},
+                  'budget':   {name: round(seconds*HEADROOM + SLACK, 3) for name, seconds in measured.items() if seconds is not None}}
+        with open(BUDGET, 'w') as budgetfile:
+            json.dump(record, budgetfile, indent=2, sort_keys=True)
+            budgetfile.write('\n')
+    else:
+        with open(BUDGET) as budgetfile:
+            record = json.load(budgetfile)
+
+    budget = record['budget']
+    if record['machine'] != machine():
+        print("budget measured on {}, this is {}: not comparable".format(record['machine'], machine()))
+
+    over = 0
+    for name, seconds in measured.items():
+        if seconds is None:
+            print("{:20s}  skipped".format(name))
+        elif name not in budget:
+            print("{:20s} {:7.3f}s  no budget".format(name, seconds))
+        else:
+            status = 'ok' if seconds <= budget[name] else 'OVER BUDGET'
+            over += seconds > budget[name]
+            print("{:20s} {:7.3f}s  budget {:7.3f}s  {}".format(name, seconds, budget[name], status))
+
+    sys.exit(1 if over else 0)
@@ -0,0 +1,175 @@
+'''
+// ---------------------------------------------------------------------------
+//
+//                                      ,`\
+//  L                              ...    /  M   M             k
+//  L      ooo   ggg  i  ccc     @ o o @.'   M\ /M  ooo  n nn  k k   ee  y   y
+//  L     o   o g   g . c      .' ( o )      M V M o   o n'  n kk   e__e y   y
+//  L     o   o g   g i c     /  (     )     M   M o   o n   n k k  e    y   y
+//  LLLLL  ooo   gggg i  ccc  \.' \ : /      M   M  ooo  n   n K  k  ee'  yyyy
+//                  g            nnn nnn                                    y
+//                gg                                                     yyy
+//
+// ------------------------------------------------------=--------------------
+//
+// Piyak - a program to monitor and log the effort on a kayak ergo.
+//
+// Copyright (c) 2017-24 Piers Barber   piers.barber@logicmonkey.co.uk
+//
+// ------------------------------------------------------=--------------------
+
+This is free software released under the terms of the MIT licence
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+'''
+Derived results cache
+
+scan_arrays() output and the stroke table (see postprocess.stroke_table)
+are saved to cache/<key>.npz so that reopening a session does not recompute
+them. The key covers everything the results depend
+upon: the dat file size, mtime and content hash, the flywheel constants and
+the cache format. Entries are evicted least recently used first once the
+cache grows beyond CACHE_SIZE bytes.
+
+The decimated levels of detail of each series for plotting (see
+decimate.py) are cached alongside in cache/<key>-lod<points>x<factor>.npz,
+so summaries never need to load them.
+'''
+
+import os
+import hashlib
+
+from postprocess import scan_session, stroke_series, session_path, flywheel
+from decimate import pyramid, POINTS, FACTOR
+
+CACHE_DIR  = 'cache'
+CACHE_SIZE = 256*1024*1024   # bytes
+FORMAT     = 2               # bump when the cached results change
+
+SERIES = ('energy', 'rpm', 'power', 'stroke', 'power_a', 'power_b')
+
+def cache_key(session):
+    path = session_path(session)
+    stat = os.stat(path)
+
+    content = hashlib.sha1()
+    with open(path, 'rb') as datfile:
+        for block in iter(lambda: datfile.read(1 << 20), b''):
+            content.update(block)
+
+    mass, radius = flywheel(session)
+
+    key = "{}:{}:{}:{}:{!r}:{!r}".format(FORMAT, stat.st_size, stat.st_mtime_ns, content.hexdigest(), mass, radius)
+
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def evict(limit=CACHE_SIZE):
+    # least recently used first, where use is the entry mtime. Other processes
+    # may be evicting at the same time so entries can vanish at any point.
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith('.npz'):
+            try:
+                stat = os.stat(os.path.join(CACHE_DIR, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, name))
+
+    total = sum(size for mtime, size, name in entries)
+
+    for mtime, size, name in sorted(entries):
+        if total <= limit:
+            break
+        try:
+            os.remove(os.path.join(CACHE_DIR, name))
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def save_entry(entry, columns, limit):
+    import numpy as np
+
+    # write to one side and rename so a half-written entry is never seen
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    temp = entry + '.{}.tmp'.format(os.getpid())
+    with open(temp, 'wb') as npzfile:
+        np.savez(npzfile, **columns)
+    os.replace(temp, entry)
+
+    evict(limit)
+
+def cached_session(session, limit=CACHE_SIZE):
+    # scan_arrays() output and the stroke table together
+    import numpy as np
+
+    entry = os.path.join(CACHE_DIR, cache_key(session) + '.npz')
+
+    if os.path.exists(entry):
+        os.utime(entry)             # mark as recently used
+        with np.load(entry) as npz:
+            return tuple((npz[name + '_x'], npz[name + '_y']) for name in SERIES), npz['strokes']
+
+    ts, energy, rpm, turns, strokes = scan_session(session)
+    results = ((ts, energy), (ts, rpm)) + stroke_series(ts, energy, turns, strokes)
+
+    columns = {'strokes': strokes}
+    for name, (x, y) in zip(SERIES, results):
+        columns[name + '_x'] = x
+        columns[name + '_y'] = y
+
+    save_entry(entry, columns, limit)
+
+    return results, strokes
+
+def cached_scan(session, limit=CACHE_SIZE):
+    return cached_session(session, limit)[0]
+
+def cached_strokes(session, limit=CACHE_SIZE):
+    return cached_session(session, limit)[1]
+
+def cached_pyramid(session, results=None, limit=CACHE_SIZE):
+    # the levels of detail of every series, a list per series coarsest first.
+    # results are the session's scan_arrays() output, if already to hand
+    import numpy as np
+
+    entry = os.path.join(CACHE_DIR, '{}-lod{}x{}.npz'.format(cache_key(session), POINTS, FACTOR))
+
+    if os.path.exists(entry):
+        os.utime(entry)             # mark as recently used
+        with np.load(entry) as npz:
+            levels = npz['levels']
+            return tuple([(npz['{}_{}_x'.format(name, k)], npz['{}_{}_y'.format(name, k)]) for k in range(n)]
+                         for name, n in zip(SERIES, levels))
+
+    if results is None:
+        results = cached_scan(session, limit)
+
+    pyramids = tuple(pyramid(x, y) for x, y in results)
+
+    columns = {'levels': np.array([len(levels) for levels in pyramids])}
+    for name, levels in zip(SERIES, pyramids):
+        for k, (x, y) in enumerate(levels):
+            columns['{}_{}_x'.format(name, k)] = x
+            columns['{}_{}_y'.format(name, k)] = y
+
+    save_entry(entry, columns, limit)
+
+    return pyramids
@@ -0,0 +1,139 @@
+'''
+// ---------------------------------------------------------------------------
+//
+//                                      ,`\
+//  L                              ...    /  M   M             k
+//  L      ooo   ggg  i  ccc     @ o o @.'   M\ /M  ooo  n nn  k k   ee  y   y
+//  L     o   o g   g . c      .' ( o )      M V M o   o n'  n kk   e__e y   y
+//  L     o   o g   g i c     /  (     )     M   M o   o n   n k k  e    y   y
+//  LLLLL  ooo   gggg i  ccc  \.' \ : /      M   M  ooo  n   n K  k  ee'  yyyy
+//                  g            nnn nnn                                    y
+//                gg                                                     yyy
+//
+// ------------------------------------------------------=--------------------
+//
+// Piyak - a program to monitor and log the effort on a kayak ergo.
+//
+// Copyright (c) 2017-24 Piers Barber   piers.barber@logicmonkey.co.uk
+//
+// ------------------------------------------------------=--------------------
+
+This is free software released under the terms of the MIT licence
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+'''
+Course View
+
+Draws progress around the course. Trackpoints are in the range [-1, 1] and
+are never rescaled point by point: a Translate and Scale put them on the
+widget, so a resize only touches the transform.
+
+The trail is built from Line instructions of up to CHUNK points each. New
+points only ever rebuild the newest chunk, so adding a trackpoint costs the
+same however long the session has run. The course is the same every lap,
+so once a whole lap is drawn the trail stops growing and only the head (the
+last leg, in yellow) moves on.
+'''
+
+from kivy.uix.widget import Widget
+from kivy.properties import NumericProperty
+from kivy.graphics import Color, Line, PushMatrix, PopMatrix, Translate, Scale
+
+class CourseView(Widget):
+
+    lap_points = NumericProperty(0)     # trackpoints in one lap, 0 for no limit
+
+    CHUNK       = 128
+    TRAIL_WIDTH = 2                     # pixels
+    HEAD_WIDTH  = 4
+
+    def __init__(self, **kwargs):
+        super(CourseView, self).__init__(**kwargs)
+
+        with self.canvas:
+            PushMatrix()
+            self._translate = Translate()
+            self._scale     = Scale()
+            Color(1, 0, 0, 1)
+        self._trail = []
+        self._chunk = []
+        self._count = 0
+
+        # the trail chunks are inserted before the head instructions
+        with self.canvas:
+            self._head_color = Color(1, 1, 0, 1)
+            self._head = Line(points=[], width=self.HEAD_WIDTH)
+            PopMatrix()
+
+        self._last = []
+        self.bind(pos=self._transform, size=self._transform)
+
+    def _unit(self):
+        # size of one course unit in pixels, matching the original 1/2.1 fit
+        return max(self.width/2.1, 1e-6)
+
+    def _transform(self, *args):
+        self._translate.x, self._translate.y = self.center
+        self._scale.x = self._scale.y = self._unit()
+
+        # line widths are in course units under the scale, so keep them in pixels
+        for line in self._trail:
+            line.width = self.TRAIL_WIDTH/self._unit()
+        self._head.width = self.HEAD_WIDTH/self._unit()
+
+    def _new_chunk(self):
+        if self._trail:
+            self._trail[-1].points = self._chunk    # freeze the full chunk
+
+        line = Line(points=self._chunk[-2:], width=self.TRAIL_WIDTH/self._unit())
+        self.canvas.insert(self.canvas.indexof(self._head_color), line)
+        self._trail.append(line)
+        self._chunk = list(self._chunk[-2:])
+
+    def add_points(self, points):
+        # points is a flat list of x, y pairs in course units
+        if not points:
+            return
+
+        self._last = (self._last + list(points))[-4:]
+        self._head.points = self._last
+
+        for i in range(0, len(points), 2):
+            if self.lap_points and self._count > self.lap_points:
+                break                   # a whole lap is drawn, the rest only overdraws it
+
+            if not self._trail or len(self._chunk) >= 2*self.CHUNK:
+                self._new_chunk()
+
+            self._chunk.extend(points[i:i+2])
+            self._count += 1
+
+        if self._trail:
+            self._trail[-1].points = self._chunk
+
+    def clear(self):
+        for line in self._trail:
+            self.canvas.remove(line)
+        self._trail = []
+        self._chunk = []
+        self._count = 0
+        self._last  = []
+        self._head.points = []
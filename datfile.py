@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+'''
+// ---------------------------------------------------------------------------
+//
+//                                      ,`\
+//  L                              ...    /  M   M             k
+//  L      ooo   ggg  i  ccc     @ o o @.'   M\ /M  ooo  n nn  k k   ee  y   y
+//  L     o   o g   g . c      .' ( o )      M V M o   o n'  n kk   e__e y   y
+//  L     o   o g   g i c     /  (     )     M   M o   o n   n k k  e    y   y
+//  LLLLL  ooo   gggg i  ccc  \.' \ : /      M   M  ooo  n   n K  k  ee'  yyyy
+//                  g            nnn nnn                                    y
+//                gg                                                     yyy
+//
+// ------------------------------------------------------=--------------------
+//
+// Piyak - a program to monitor and log the effort on a kayak ergo.
+//
+// Copyright (c) 2017-24 Piers Barber   piers.barber@logicmonkey.co.uk
+//
+// ------------------------------------------------------=--------------------
+
+This is free software released under the terms of the MIT licence
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+'''
+Session dat files
+
+Every flywheel revolution is logged as its period in microseconds. The
+original format was one ASCII integer per line. The binary format replaces
+it with a fixed header and a packed array so that a session can be mapped
+straight into memory with no parsing:
+
+    offset  size  field
+         0     4  magic 'PIYK'
+         4     2  format version
+         6     2  header size (data starts here)
+         8     8  session start, microseconds since the epoch
+        16     8  flywheel mass in kilogrammes
+        24     8  flywheel radius in metres
+        32     8  sample count (zero until the recording is closed)
+        40   4*n  periods, little-endian uint32 microseconds
+
+If a recording is not closed cleanly the sample count is left at zero and
+the count is taken from the file size instead.
+
+Both formats use the .dat extension and are told apart by the magic. To
+convert legacy text files in place, or to dump a session as text:
+
+  Usage:
+    datfile.py [-t] <dat file or directory> ...
+'''
+
+import os
+import sys
+import time
+import queue
+import struct
+import threading
+from array import array
+from datetime import datetime
+
+# numpy is only imported by the readers so that recording never pays for it
+
+MAGIC   = b'PIYK'
+VERSION = 1
+HEADER  = struct.Struct('<4sHHqddQ')
+
+class dat_writer:
+    def __init__(self, path, time_start, mass, radius):
+        self.path   = path
+        self.count  = 0
+        self._file  = open(path, 'wb')
+
+        self._start = int(time_start.timestamp() * 1000000)
+        self._mass   = mass
+        self._radius = radius
+
+        self._file.write(HEADER.pack(MAGIC, VERSION, HEADER.size, self._start, mass, radius, 0))
+
+    def write(self, period):
+        self._file.write(struct.pack('<I', period))
+        self.count += 1
+
+    def write_periods(self, periods):
+        block = array('I', periods)
+        if sys.byteorder == 'big':
+            block.byteswap()
+        self._file.write(block.tobytes())
+        self.count += len(block)
+
+    def flush(self):
+        self._file.flush()
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        # patch in the final sample count
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, VERSION, HEADER.size, self._start, self._mass, self._radius, self.count))
+        self.sync()
+        self._file.close()
+
+class session_writer:
+    # A dat_writer on its own thread so that a slow SD card never stalls the
+    # caller. Periods are queued and written out as one block, flushed and
+    # synced to disk every sync_interval seconds, so at most that much of a
+    # session is lost if the power goes. The time each block takes to write
+    # and the queue depth show when the card is the bottleneck.
+    def __init__(self, path, time_start, mass, radius, sync_interval=5.0):
+        self._writer = dat_writer(path, time_start, mass, radius)
+        self._queue  = queue.Queue()
+
+        self.path          = path
+        self.sync_interval = sync_interval
+        self.blocks        = 0      # blocks written
+        self.latency       = 0.0    # seconds to write and sync the last block
+        self.latency_max   = 0.0
+        self.latency_total = 0.0
+        self.depth_max     = 0      # most batches ever waiting in the queue
+
+        self._thread = threading.Thread(target=self._run, name='session_writer', daemon=True)
+        self._thread.start()
+
+    def write(self, period):
+        self.write_periods((period,))
+
+    def write_periods(self, periods):
+        # copied, so the caller is free to reuse its buffer straight away
+        if len(periods):
+            self._queue.put(array('I', periods))
+            self.depth_max = max(self.depth_max, self._queue.qsize())
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    @property
+    def count(self):
+        return self._writer.count
+
+    def _run(self):
+        closing  = False
+        deadline = time.monotonic() + self.sync_interval
+
+        while not closing:
+            block = []
+
+            # gather everything that arrives before the deadline into one block
+            while not closing:
+                try:
+                    periods = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+
+                if periods is None:
+                    closing = True
+                else:
+                    block.extend(periods)
+
+            start = time.monotonic()
+
+            if len(block):
+                self._writer.write_periods(block)
+            self._writer.sync()
+
+            self.latency        = time.monotonic() - start
+            self.latency_max    = max(self.latency_max, self.latency)
+            self.latency_total += self.latency
+            self.blocks        += 1
+
+            deadline = time.monotonic() + self.sync_interval
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._writer.close()
+
+def is_binary(path):
+    with open(path, 'rb') as datfile:
+        return datfile.read(len(MAGIC)) == MAGIC
+
+def read_header(path):
+    with open(path, 'rb') as datfile:
+        raw = datfile.read(HEADER.size)
+
+    magic, version, size, start, mass, radius, count = HEADER.unpack(raw)
+
+    if magic != MAGIC:
+        raise ValueError("{} is not a binary session file".format(path))
+    if version > VERSION:
+        raise ValueError("{} has unsupported format version {}".format(path, version))
+
+    # an unfinished recording has no count so trust the file size
+    available = (os.path.getsize(path) - size) // 4
+    if count == 0 or count > available:
+        count = available
+
+    return {'version': version,
+            'offset':  size,
+            'start':   datetime.fromtimestamp(start / 1000000),
+            'mass':    mass,
+            'radius':  radius,
+            'count':   count}
+
+def read_periods(path):
+    # returns the header (None for a legacy text file) and the periods. Binary
+    # files are memory mapped read-only so nothing is parsed or copied here.
+    import numpy as np
+
+    if is_binary(path):
+        header = read_header(path)
+        if header['count'] == 0:
+            return header, np.zeros(0, dtype='<u4')
+        return header, np.memmap(path, dtype='<u4', mode='r', offset=header['offset'], shape=(header['count'],))
+
+    # legacy text, one integer per line. Early recordings logged 'None' before
+    # the first full revolution - it carries no information so it reads as 0
+    with open(path, 'rb') as datfile:
+        words = datfile.read().replace(b'None', b'0').split()
+
+    return None, np.array(words, dtype=np.int64)
+
+def session_start(path):
+    # legacy sessions only have their start time in the file name
+    return datetime.strptime(os.path.basename(path)[:12], "%Y%m%d%H%M")
+
+def convert(path, mass, radius):
+    # rewrite a legacy text file as binary, atomically and keeping its mtime
+    if is_binary(path):
+        return False
+
+    header, periods = read_periods(path)
+    stat = os.stat(path)
+
+    temp = path + '.tmp'
+    writer = dat_writer(temp, session_start(path), mass, radius)
+    writer.write_periods(periods.tolist())
+    writer.close()
+
+    os.utime(temp, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(temp, path)
+
+    return True
+
+def dat_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith('.dat'):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+if __name__ == '__main__' :
+
+    import argparse
+    from strokes import MASS, RADIUS
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs='+', help="Session dat files or directories of them")
+    parser.add_argument("-t", '--text', action="store_true", help="Dump periods as text instead of converting")
+    args = parser.parse_args()
+
+    for path in dat_files(args.paths):
+        if args.text:
+            header, periods = read_periods(path)
+            sys.stdout.write(''.join("{}\n".format(p) for p in periods.tolist()))
+        elif convert(path, MASS, RADIUS):
+            print("Converted {}".format(path))
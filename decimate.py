@@ -0,0 +1,98 @@
+'''
+// ---------------------------------------------------------------------------
+//
+//                                      ,`\
+//  L                              ...    /  M   M             k
+//  L      ooo   ggg  i  ccc     @ o o @.'   M\ /M  ooo  n nn  k k   ee  y   y
+//  L     o   o g   g . c      .' ( o )      M V M o   o n'  n kk   e__e y   y
+//  L     o   o g   g i c     /  (     )     M   M o   o n   n k k  e    y   y
+//  LLLLL  ooo   gggg i  ccc  \.' \ : /      M   M  ooo  n   n K  k  ee'  yyyy
+//                  g            nnn nnn                                    y
+//                gg                                                     yyy
+//
+// ------------------------------------------------------=--------------------
+//
+// Piyak - a program to monitor and log the effort on a kayak ergo.
+//
+// Copyright (c) 2017-24 Piers Barber   piers.barber@logicmonkey.co.uk
+//
+// ------------------------------------------------------=--------------------
+
+This is free software released under the terms of the MIT licence
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+'''
+Decimation
+
+A session has tens of thousands of samples but the world view is only a
+thousand or so pixels wide, so drawing every one is wasted effort. minmax()
+keeps the smallest and largest sample in each of a number of equal buckets,
+so a peak is never lost however far the series is thinned. pyramid() holds
+the series at several such levels of detail, each FACTOR times finer than
+the last, for choosing the one that suits the pixels available.
+'''
+
+# numpy is imported in the functions so importing this module stays cheap
+
+POINTS = 2048   # points at the coarsest level
+FACTOR = 4      # how much finer each level is than the one before
+
+def minmax(x, y, buckets):
+    # at most 2*buckets+2 points: the min and max of each bucket, in time
+    # order, and the first and last point
+    import numpy as np
+
+    n = len(y)
+    if n <= 2*buckets + 2:
+        return x, y
+
+    size = -(-n // buckets)     # ceiling, so there are at most buckets of them
+    full = (n // size) * size
+
+    blocks = np.asarray(y[:full]).reshape(-1, size)
+    base   = np.arange(len(blocks)) * size
+
+    keep = [base + blocks.argmin(axis=1), base + blocks.argmax(axis=1), [0, n-1]]
+    if full < n:
+        tail = np.asarray(y[full:])
+        keep.append([full + tail.argmin(), full + tail.argmax()])
+
+    index = np.unique(np.concatenate(keep))
+    return x[index], y[index]
+
+def pyramid(x, y, points=POINTS, factor=FACTOR):
+    # coarsest first, stopping short of the full series itself
+    levels  = []
+    buckets = points // 2
+    while 2*buckets + 2 < len(y):
+        levels.append(minmax(x, y, buckets))
+        buckets *= factor
+    return levels
+
+def level(levels, x, y, points):
+    # the finest level with no more than points, or the full series if short enough
+    if len(y) <= points or not levels:
+        return x, y
+    best = levels[0]
+    for lx, ly in levels:
+        if len(ly) <= points:
+            best = (lx, ly)
+    return best
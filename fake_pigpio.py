@@ -0,0 +1,215 @@
+'''
+// ---------------------------------------------------------------------------
+//
+//                                      ,`\
+//  L                              ...    /  M   M             k
+//  L      ooo   ggg  i  ccc     @ o o @.'   M\ /M  ooo  n nn  k k   ee  y   y
+//  L     o   o g   g . c      .' ( o )      M V M o   o n'  n kk   e__e y   y
+//  L     o   o g   g i c     /  (     )     M   M o   o n   n k k  e    y   y
+//  LLLLL  ooo   gggg i  ccc  \.' \ : /      M   M  ooo  n   n K  k  ee'  yyyy
+//                  g            nnn nnn                                    y
+//                gg                                                     yyy
+//
+// ------------------------------------------------------=--------------------
+//
+// Piyak - a program to monitor and log the effort on a kayak ergo.
+//
+// Copyright (c) 2017-24 Piers Barber   piers.barber@logicmonkey.co.uk
+//
+// ------------------------------------------------------=--------------------
+
+This is free software released under the terms of the MIT licence
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+'''
+Fake pigpio
+
+A local stand-in for the parts of pigpio used by gpio_pin and piyak.py, so
+the capture path runs without a Raspberry Pi or pigpiod. Nothing falls back
+to it: replay.py, piyak-demo.py and bench_capture.py pass its pi() in as the
+device, and the real app still needs pigpio. Edges come from
+any sequence of flywheel periods in microseconds: a recorded session with
+dat_periods(), a steady rate with steady(), or any generator.
+
+  import fake_pigpio as pigpio
+
+  device = pigpio.pi(pigpio.dat_periods('dat/201806121825.dat'))
+  device.start(speed=10)       # a thread of its own, ten times real time
+  ...
+  device.advance(tick)         # or step it: every edge up to tick, now
+
+Callbacks get a rising edge (level 1) for every edge and a watchdog timeout
+(level 2) every watchdog period without one, exactly as from pigpio, with
+ticks that wrap at 32 bits. Start the tick just short of 2**32 to check the
+wraparound is handled. The callbacks run on the replay thread, like the
+pigpio callback thread, and can be driven far faster than any flywheel:
+bench_capture.py uses steady() to find the capture path's ceiling.
+'''
+
+import time
+import threading
+from itertools import chain, repeat
+
+INPUT  = 0
+OUTPUT = 1
+
+RISING_EDGE  = 0
+FALLING_EDGE = 1
+EITHER_EDGE  = 2
+
+TIMEOUT = 2     # the level reported for a watchdog timeout
+
+def tickDiff(t1, t2):
+    # microseconds from t1 to t2, allowing for one wrap of the 32 bit tick
+    tDiff = t2 - t1
+    if tDiff < 0:
+        tDiff += (1 << 32)
+    return tDiff
+
+def dat_periods(path):
+    # the periods of a recorded session, leaving out the zeros that early
+    # text recordings have in place of a first revolution
+    import datfile
+    header, periods = datfile.read_periods(path)
+    return [int(p) for p in periods if p]
+
+def steady(period, count=None):
+    # one edge every period microseconds, for ever or count times
+    return repeat(period) if count is None else repeat(period, count)
+
+class _callback:
+    def __init__(self, pi, gpio, edge, func):
+        self.pi    = pi
+        self.gpio  = gpio
+        self.edge  = edge
+        self.func  = func
+        self.count = 0
+
+    def tally(self):
+        return self.count
+
+    def reset_tally(self):
+        self.count = 0
+
+    def cancel(self):
+        with self.pi._lock:
+            if self in self.pi._callbacks:
+                self.pi._callbacks.remove(self)
+
+class pi:
+
+    # edges on every gpio are timed by periods (microseconds). No periods is
+    # a flywheel that never turns.
+
+    def __init__(self, periods=(), start_tick=0):
+        self._periods   = iter(periods)
+        self._now       = start_tick    # microseconds, not wrapped
+        self._edge      = start_tick    # the next edge, the first one straight away
+        self._timeout   = None          # the last edge or watchdog timeout
+        self._watchdog  = 0             # milliseconds
+        self._callbacks = []
+        self._lock      = threading.Lock()
+        self._thread    = None
+        self._running   = False
+        self.connected  = True
+        self.finished   = False
+        self.edges      = 0
+
+        # the first edge is at start_tick, unless there are no periods at all
+        try:
+            first = next(self._periods)
+        except StopIteration:
+            self.finished = True
+        else:
+            self._periods = chain([first], self._periods)
+
+    def set_mode(self, gpio, mode):
+        return 0
+
+    def set_glitch_filter(self, gpio, steady):
+        return 0
+
+    def set_watchdog(self, user_gpio, wdog_timeout):
+        self._watchdog = wdog_timeout
+        return 0
+
+    def callback(self, user_gpio, edge=RISING_EDGE, func=None):
+        cb = _callback(self, user_gpio, edge, func)
+        with self._lock:
+            self._callbacks.append(cb)
+        return cb
+
+    def get_current_tick(self):
+        return self._now & 0xffffffff
+
+    def _emit(self, level, tick):
+        self._now = tick
+        with self._lock:
+            callbacks = list(self._callbacks)
+        for cb in callbacks:
+            cb.count += 1
+            if cb.func is not None:
+                cb.func(cb.gpio, level, tick & 0xffffffff)
+
+    def advance(self, until):
+        # every edge and watchdog timeout up to tick until (not wrapped), in order
+        while not self.finished:
+            if self._watchdog and self._timeout is not None:
+                timeout = self._timeout + 1000*self._watchdog
+                if timeout < self._edge:
+                    if timeout > until:
+                        break
+                    self._timeout = timeout
+                    self._emit(TIMEOUT, timeout)
+                    continue
+
+            if self._edge > until:
+                break
+            self._emit(1, self._edge)
+            self._timeout = self._edge
+            self.edges   += 1
+
+            try:
+                self._edge += int(next(self._periods))
+            except StopIteration:
+                self.finished = True
+
+        self._now = max(self._now, until)
+
+    def start(self, speed=1.0):
+        # replay on a thread of its own, speed times real time
+        def run():
+            t0    = time.perf_counter()
+            tick0 = self._now
+            while self._running and not self.finished:
+                time.sleep(0.001)
+                self.advance(tick0 + int(1e6 * speed * (time.perf_counter() - t0)))
+
+        self._running = True
+        self._thread  = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread   = None
+        self.connected = False
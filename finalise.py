@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+'''
+// ---------------------------------------------------------------------------
+//
+//                                      ,`\
+//  L                              ...    /  M   M             k
+//  L      ooo   ggg  i  ccc     @ o o @.'   M\ /M  ooo  n nn  k k   ee  y   y
+//  L     o   o g   g . c      .' ( o )      M V M o   o n'  n kk   e__e y   y
+//  L     o   o g   g i c     /  (     )     M   M o   o n   n k k  e    y   y
+//  LLLLL  ooo   gggg i  ccc  \.' \ : /      M   M  ooo  n   n K  k  ee'  yyyy
+//                  g            nnn nnn                                    y
+//                gg                                                     yyy
+//
+// ------------------------------------------------------=--------------------
+//
+// Piyak - a program to monitor and log the effort on a kayak ergo.
+//
+// Copyright (c) 2017-24 Piers Barber   piers.barber@logicmonkey.co.uk
+//
+// ------------------------------------------------------=--------------------
+
+This is free software released under the terms of the MIT licence
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+'''
+Session Finalisation
+
+Everything done at the end of a session that takes longer than the user
+should wait for: the post-processed session plot. The TCX activity file is
+streamed out by the app as the session runs (see tcx.py).
+Piyak writes what it knows about the session to activities/<session>.pending
+and runs this in a separate process, so the app exits straight away.
+
+A finished session gets an activities/<session>.done marker and its pending
+file removed. A pending file left behind means finalisation was interrupted
+and it is picked up again by sweep() the next time Piyak starts.
+
+  Usage:
+    finalise.py [<activitydate> ...]    (no sessions: every pending one)
+'''
+
+import os
+import sys
+import json
+import glob
+import fcntl
+import subprocess
+
+ACTIVITIES = 'activities'
+
+def pending_path(session):
+    return os.path.join(ACTIVITIES, session + '.pending')
+
+def done_path(session):
+    return os.path.join(ACTIVITIES, session + '.done')
+
+def write_pending(session, details):
+    # write to one side and rename so a job never sees half a file
+    temp = pending_path(session) + '.tmp'
+    with open(temp, 'w') as pending:
+        json.dump(details, pending)
+    os.replace(temp, pending_path(session))
+
+def launch(session=None):
+    # run in a new process group so the job outlives the app. With no session
+    # the job finalises everything pending.
+    here = os.path.dirname(os.path.abspath(__file__))
+    args = [sys.executable, os.path.join(here, 'finalise.py')]
+    if session is not None:
+        args.append(session)
+
+    return subprocess.Popen(args, start_new_session=True)
+
+def sweep():
+    # finish any session whose finalisation was interrupted
+    if glob.glob(os.path.join(ACTIVITIES, '*.pending')):
+        return launch()
+    return None
+
+def plot_session(session, dat):
+    # read in the full detail from the session dat file and post-process it
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from postprocess import scan_arrays
+
+    energy, rpm, power, stroke, power_a, power_b = scan_arrays(dat)
+
+    xlabel    = 'Time (seconds)'
+    xtitle    = 'Session: {}'.format(session)
+    rpm_label = 'Revolutions\n(per minute)'
+    eny_label = 'Rotational\nEnergy\n(joules)'
+    pwr_label = 'Power\n(watts)'
+    stk_label = 'Double Strokes\n(per minute)'
+
+    fig, (rpm_axes, eny_axes, pwr_axes, stk_axes) = plt.subplots(4, sharex=True)
+
+    x, y = rpm
+    rpm_dots, = rpm_axes.plot(x, y, 'green', marker='.', label='samples')
+    rpm_axes.grid(visible=True)
+    rpm_axes.set_ylabel(rpm_label)
+
+    x, y = energy
+    eny_line, = eny_axes.plot(x, y, 'blue', label='line')
+    eny_axes.grid(visible=True)
+    eny_axes.set_ylabel(eny_label)
+
+    x, y = power
+    pwr_axes.plot(x, y, color='orange')
+    pwr_axes.grid(visible=True)
+    pwr_axes.set_ylabel(pwr_label)
+
+    x, y = stroke
+    stk_axes.plot(x, y, color='gray')
+    stk_axes.grid(visible=True)
+    stk_axes.set_ylabel(stk_label)
+
+    rpm_axes.set_title(xtitle)
+    stk_axes.set_xlabel(xlabel)
+
+    plt.tight_layout()
+
+    fig.savefig(os.path.join(ACTIVITIES, session + ".png"))
+    plt.close(fig)
+
+def finalise(session):
+    try:
+        pending = open(pending_path(session))
+    except FileNotFoundError:
+        return False                    # already finished
+
+    with pending:
+        # only one job per session, a second one just leaves it be
+        try:
+            fcntl.flock(pending, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+
+        # killed between marking it done and removing the pending file
+        if os.path.exists(done_path(session)):
+            os.remove(pending_path(session))
+            return False
+
+        details = json.load(pending)
+
+        plot_session(session, details['dat'])
+
+        # the activity is streamed by the app, pending files from before
+        # that have none to list
+        made = [session + '.png']
+        if details.get('tcx') and os.path.exists(details['tcx']):
+            made.insert(0, os.path.basename(details['tcx']))
+
+        with open(done_path(session), 'w') as done:
+            done.write(''.join(name + '\n' for name in made))
+
+        os.remove(pending_path(session))
+
+    return True
+
+if __name__ == '__main__' :
+
+    sessions = sys.argv[1:]
+    if not sessions:
+        sessions = sorted(os.path.basename(p)[:-len('.pending')] for p in glob.glob(os.path.join(ACTIVITIES, '*.pending')))
+
+    for session in sessions:
+        finalise(session)
@@ -38,80 +38,134 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 '''
-import math
-from math import pi, sin, cos, radians, sqrt, degrees, asin
-
-def generate_track(curve, location):
-    # ------------------------------------------------------------------------------
-    # haversine returns the distance between two points {latitude, longitude}
-    def haversine(p, q):
-
-        dlat = radians(q['lat'] - p['lat'])
-        dlon = radians(q['lon'] - p['lon'])
-        lat1 = radians(p['lat'])
-        lat2 = radians(q['lat'])
-
-        a = sin(dlat/2)**2 + cos(lat1)*cos(lat2)*sin(dlon/2)**2
-        c = 2*asin(sqrt(a))
-
-        return c * R * 1000 # return value in metres
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from math import pi, radians
+
+# numpy is only needed to generate a track that is not already cached
+
+CACHE_DIR = 'cache'
+TRACKRES  = 500
+MAGIC     = b'PTRK'
+VERSION   = 1
+HEADER    = struct.Struct('=4sHId')   # magic, version, points, lap length
+
+ORIGINS = {'oxenhope': {'lat':  53.8100160, 'lon':   -1.9596520},
+           'waikiki':  {'lat':  21.2765000, 'lon': -157.8460000},
+           'capetown': {'lat': -34.2452585, 'lon':   18.6372443}}
+
+class track_points:
+    # one array of doubles per column, indexed by trackpoint
+    COLUMNS = ('lat', 'lon', 'dist', 'x', 'y')
+
+    def __init__(self, lat, lon, dist, x, y):
+        self.lat  = lat
+        self.lon  = lon
+        self.dist = dist
+        self.x    = x
+        self.y    = y
+
+    def __len__(self):
+        return len(self.dist)
+
+    def reached(self, distance, track_length):
+        # how many trackpoints, counting every lap, lie strictly behind the
+        # distance covered. A binary search of the cumulative distances.
+        lap, within = divmod(distance, track_length)
+        return int(lap)*len(self) + bisect_left(self.dist, within)
+
+def compute_track(curve, location, resolution):
+    import numpy as np
+
+    R = 6371                  # earth radius in km
+    r = 1.00                  # radius used in xy geometry
 
     # ------------------------------------------------------------------------------
     # geometry in the xy plane - here are some nice curves
     def geometry(t, c):
         if c == 'circle':
-            x = r*cos(t)
-            y = r*sin(t)
+            x = r*np.cos(t)
+            y = r*np.sin(t)
         if c == 'bernoulli':
-            x = r*sqrt(2)*cos(t)/(sin(t)*sin(t)+1)
-            y = r*sqrt(2)*cos(t)*sin(t)/(sin(t)*sin(t)+1)
+            x = r*np.sqrt(2)*np.cos(t)/(np.sin(t)*np.sin(t)+1)
+            y = r*np.sqrt(2)*np.cos(t)*np.sin(t)/(np.sin(t)*np.sin(t)+1)
         if c == 'gerono':
-            x = r*cos(t)
-            y = r*cos(t)*sin(t)
-        return (x, y)
-
-    # ------------------------------------------------------------------------------
-    # xy to geographical coordinates
-    def geographical(p, l):
-        x, y = p
+            x = r*np.cos(t)
+            y = r*np.cos(t)*np.sin(t)
+        return x, y
 
-        if l == 'oxenhope':
-            o = {'lat':  53.8100160, 'lon':   -1.9596520}
-        if l == 'waikiki':
-            o = {'lat':  21.2765000, 'lon': -157.8460000}
-        if l == 'capetown':
-            o = {'lat': -34.2452585, 'lon':   18.6372443}
+    # assuming curves have 2*pi periodicity
+    theta = np.arange(resolution) * (2*pi/resolution)
 
-        # world coordinates R in km -> x,y in km, {lat, lon} in degrees
-        lat = o['lat'] + degrees(y/R)
-        lon = o['lon'] + degrees(x/(R*cos(radians(o['lat']))))
+    # calculate xy coordinates and map to geographical.
+    # R in km and geometry x,y in km {lat, lon} in degrees
+    x, y = geometry(theta, curve)
 
-        return {'lat': lat, 'lon': lon, 'x': x, 'y': y}
+    o = ORIGINS[location]
+    lat = o['lat'] + np.degrees(y/R)
+    lon = o['lon'] + np.degrees(x/(R*np.cos(radians(o['lat']))))
 
     # ------------------------------------------------------------------------------
-    # generate_track
-    R        = 6371                  # earth radius in km
-    r        = 1.00                  # radius used in xy geometry
-    TRACKRES = 500
-    dtheta   = 2*pi/TRACKRES         # assuming curves have 2*pi periodicity
-    theta    = 0
-    track    = []
-    dist     = 0
-    q        = {}
-
-    for step in range(TRACKRES):
-        # calculate xy coordinates and map to geographical.
-        # R in km and geometry x,y in km {lat, lon} in degrees
-        p = geographical(geometry(theta, curve), location)
-
-        if theta > 0: # calculate distance to last point
-            dist += haversine(p, q)
-
-        track.append({'lat': p['lat'], 'lon': p['lon'], 'dist': dist, 'x': p['x'], 'y': p['y']})
-        theta += dtheta
-        q = p
-
-    # close the loop to the first point from the last for full lap distance
-    track_length = dist + haversine(q, geographical(geometry(0, curve), location))
+    # haversine distance from each point to the next, the last one closing the
+    # loop back to the first point for the full lap distance
+    phi  = np.radians(lat)
+    lam  = np.radians(lon)
+    dlat = np.roll(phi, -1) - phi
+    dlon = np.roll(lam, -1) - lam
+
+    a = np.sin(dlat/2)**2 + np.cos(phi)*np.cos(np.roll(phi, -1))*np.sin(dlon/2)**2
+    step = 2*np.arcsin(np.sqrt(a)) * R * 1000 # in metres
+
+    dist = np.zeros(resolution)
+    dist[1:] = np.cumsum(step[:-1])
+
+    # the bytes of each numpy column go straight into an array of doubles
+    track = track_points(*(array('d', column.tobytes()) for column in (lat, lon, dist, x, y)))
+
+    return track, dist[-1] + step[-1]
+
+def cache_path(curve, location, resolution):
+    return os.path.join(CACHE_DIR, 'track_{}_{}_{}.trk'.format(curve, location, resolution))
+
+def load_track(path):
+    with open(path, 'rb') as trkfile:
+        magic, version, points, track_length = HEADER.unpack(trkfile.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            return None
+
+        columns = []
+        for column in track_points.COLUMNS:
+            values = array('d')
+            values.fromfile(trkfile, points)
+            columns.append(values)
+
+    return track_points(*columns), track_length
+
+def save_track(path, track, track_length):
+    # write to one side and rename so a partial file is never loaded
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    temp = path + '.{}.tmp'.format(os.getpid())
+    with open(temp, 'wb') as trkfile:
+        trkfile.write(HEADER.pack(MAGIC, VERSION, len(track), track_length))
+        for column in track_points.COLUMNS:
+            getattr(track, column).tofile(trkfile)
+    os.replace(temp, path)
+
+def generate_track(curve, location, resolution=TRACKRES):
+    # tracks are cached on disk as they never change
+    path = cache_path(curve, location, resolution)
+
+    try:
+        cached = load_track(path)
+    except (OSError, EOFError, struct.error):
+        cached = None
+
+    if cached is not None:
+        return cached
+
+    track, track_length = compute_track(curve, location, resolution)
+    save_track(path, track, track_length)
 
     return track, track_length
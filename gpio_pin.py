@@ -38,10 +38,20 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 '''
-import pigpio
+import threading
+from array import array
+
+# the pigpio constants used here. The device is always passed in, pigpio.pi()
+# on the ergo or fake_pigpio.pi() away from it, so pigpio itself isn't needed
+INPUT       = 0
+RISING_EDGE = 0
+
+def tickDiff(t1, t2):
+   # microseconds from t1 to t2 on the 32 bit pigpio tick, as pigpio.tickDiff
+   return (t2 - t1) & 0xffffffff
 
 class gpio_pin:
-   def __init__(self, device, gpio):
+   def __init__(self, device, gpio, queue_size=4096):
       self.device = device
       self.gpio   = gpio
 
@@ -50,6 +60,20 @@ class gpio_pin:
       self._last_edge  = None
       self._delta      = None
 
+      # every period is queued for the consumer in a ring buffer, along with
+      # the pigpio tick of the edge that ended it. The callback runs on the
+      # pigpio thread so head and tail are only moved under the lock. If the
+      # consumer falls a whole buffer behind new periods are dropped and
+      # counted rather than overwriting ones not yet read.
+      self._queue   = array('L', [0]) * queue_size
+      self._ticks   = array('L', [0]) * queue_size
+      self._qview   = memoryview(self._queue)
+      self._tview   = memoryview(self._ticks)
+      self._head    = 0      # periods ever queued
+      self._tail    = 0      # periods ever drained
+      self._dropped = 0
+      self._lock    = threading.Lock()
+
       # debounce in software
       #   the magnet is at 15 cm radius
       #   one revolution has circumference 2pi*0.15 = 3.2*0.3 = 0.96 m
@@ -61,18 +85,27 @@ class gpio_pin:
 
       DEBOUNCE = 200 # microseconds
 
-      device.set_mode(gpio, pigpio.INPUT)
+      device.set_mode(gpio, INPUT)
       device.set_glitch_filter(gpio, DEBOUNCE)
       device.set_watchdog(gpio, self._watchdog)
 
       # finally instantiate a callback function for activity on this pin
-      self._cb = device.callback(gpio, pigpio.RISING_EDGE, self._cbf)
+      self._cb = device.callback(gpio, RISING_EDGE, self._cbf)
 
    def _cbf(self, gpio, level, now):
       if level == 1: # rising edge
 
          if self._last_edge is not None:
-            self._delta = pigpio.tickDiff(self._last_edge, now)
+            self._delta = tickDiff(self._last_edge, now)
+
+            with self._lock:
+               if self._head - self._tail < len(self._queue):
+                  i = self._head % len(self._queue)
+                  self._queue[i] = self._delta
+                  self._ticks[i] = now
+                  self._head += 1
+               else:
+                  self._dropped += 1
 
          self._eventcount += 1
          self._last_edge = now
@@ -83,6 +116,33 @@ class gpio_pin:
             if self._delta < 2000000000: # 2e9
                self._delta += (self._watchdog * 1000)
 
+   def drain_into(self, ticks, periods):
+      # copy everything queued since the last drain, oldest first, into the
+      # caller's arrays of edge ticks and periods and return how many. Both
+      # are preallocated by the caller (typecode 'L', at least queue_size
+      # long), so draining allocates nothing per period
+      with self._lock:
+         size  = len(self._queue)
+         count = min(self._head - self._tail, len(periods))
+         first = self._tail % size
+         part  = min(count, size - first)
+
+         tv = memoryview(ticks)
+         pv = memoryview(periods)
+         tv[:part] = self._tview[first:first+part]
+         pv[:part] = self._qview[first:first+part]
+         if count > part:
+            tv[part:count] = self._tview[:count-part]
+            pv[part:count] = self._qview[:count-part]
+
+         self._tail += count
+
+      return count
+
+   @property
+   def dropped(self):
+      return self._dropped
+
    def cancel(self):
       # clean up
       self.device.set_watchdog(self.gpio, 0) # zero watchdog
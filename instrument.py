@@ -0,0 +1,143 @@
+'''
+// ---------------------------------------------------------------------------
+//
+//                                      ,`\
+//  L                              ...    /  M   M             k
+//  L      ooo   ggg  i  ccc     @ o o @.'   M\ /M  ooo  n nn  k k   ee  y   y
+//  L     o   o g   g . c      .' ( o )      M V M o   o n'  n kk   e__e y   y
+//  L     o   o g   g i c     /  (     )     M   M o   o n   n k k  e    y   y
+//  LLLLL  ooo   gggg i  ccc  \.' \ : /      M   M  ooo  n   n K  k  ee'  yyyy
+//                  g            nnn nnn                                    y
+//                gg                                                     yyy
+//
+// ------------------------------------------------------=--------------------
+//
+// Piyak - a program to monitor and log the effort on a kayak ergo.
+//
+// Copyright (c) 2017-24 Piers Barber   piers.barber@logicmonkey.co.uk
+//
+// ------------------------------------------------------=--------------------
+
+This is free software released under the terms of the MIT licence
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+'''
+Instrumentation
+
+Timing of the live update loop, switched on by setting PIYAK_METRICS in the
+environment. Off, it costs nothing: the app never creates an instrument.
+
+For every update tick it records
+  - how long the tick took, and how many went over the frame budget
+  - how many periods were drained from the pin
+  - the edge to display latency, from the pigpio tick of the newest edge
+    drained to the pigpio tick when the display was updated from it
+and keeps the number of periods dropped by the pin because the display fell
+a whole queue behind. Each is a fixed bin histogram, so recording is
+constant time and a session of any length takes the same memory.
+'''
+
+import json
+import time
+from bisect import bisect_right
+
+BUDGET = 1000.0/60.0   # milliseconds per tick at 60Hz
+
+TICK_BINS    = [1, 2, 4, 8, BUDGET, 33.3, 50, 100]    # ms
+LATENCY_BINS = [1, 2, 4, 8, 16, 32, 64, 128, 256]     # ms
+DRAIN_BINS   = [0, 1, 2, 4, 8, 16, 32, 64]            # periods
+
+class histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # last bin is everything above the top bound
+        self.count  = 0
+        self.total  = 0.0
+        self.max    = 0.0
+
+    def add(self, value):
+        self.counts[bisect_right(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.total/self.count if self.count else 0.0
+
+    def percentile(self, p):
+        # upper bound of the bin holding the pth percentile
+        if not self.count:
+            return 0.0
+        need = p/100.0 * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= need:
+                return bound
+        return self.max
+
+    def summary(self):
+        return {'bounds': self.bounds, 'counts': self.counts, 'count': self.count,
+                'mean': self.mean, 'max': self.max}
+
+class instrument:
+    def __init__(self, budget=BUDGET):
+        self.budget   = budget
+        self.ticks    = histogram(TICK_BINS)
+        self.latency  = histogram(LATENCY_BINS)
+        self.drained  = histogram(DRAIN_BINS)
+        self.overruns = 0
+        self.dropped  = 0
+        self.started  = time.time()
+
+    def tick(self, seconds):
+        ms = 1000.0 * seconds
+        self.ticks.add(ms)
+        if ms > self.budget:
+            self.overruns += 1
+
+    def drain(self, periods, latency_us=None):
+        # latency_us is None when nothing was drained
+        self.drained.add(periods)
+        if latency_us is not None:
+            self.latency.add(latency_us/1000.0)
+
+    def text(self):
+        # a few lines for the on-screen overlay
+        return ("tick {:.1f}ms mean {:.1f}ms max, {} over {:.1f}ms\n"
+                "latency {:.1f}ms mean <{}ms p95 {:.1f}ms max\n"
+                "drained {:.1f} per tick {:.0f} max, {} dropped").format(
+                    self.ticks.mean, self.ticks.max, self.overruns, self.budget,
+                    self.latency.mean, self.latency.percentile(95), self.latency.max,
+                    self.drained.mean, self.drained.max, self.dropped)
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump({'started':  self.started,
+                       'duration': time.time() - self.started,
+                       'budget':   self.budget,
+                       'overruns': self.overruns,
+                       'dropped':  self.dropped,
+                       'tick_ms':    self.ticks.summary(),
+                       'latency_ms': self.latency.summary(),
+                       'drained':    self.drained.summary()}, f, indent=1)
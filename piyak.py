@@ -54,83 +54,80 @@ switch.
                   3V3    GPIO2                    GND
 '''
 
-import pigpio
-from gpio_pin import gpio_pin
-
 from kivy.app import App
 
-from kivy.uix.gridlayout import GridLayout
+# only what the Python code uses is imported here, the widgets and graphics in
+# piyak.kv are found by the kivy factory when the rules are applied
 from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.image import Image
 from kivy.uix.label import Label
-from kivy.uix.scatter import Scatter
-from kivy.uix.behaviors import ToggleButtonBehavior, ButtonBehavior
-from kivy.uix.button import Button
-
-from kivy.graphics.vertex_instructions import Line, Rectangle
 
-from kivy.properties import NumericProperty, ListProperty
+from kivy.properties import NumericProperty
 
 from kivy.clock import Clock
 
 from kivy.core.window import Window
 
-import os, errno
-
-from datetime import datetime, timedelta
-
-import math
-
-from collections import deque
-
-from generate_track import generate_track
-from tcx import tcx_preamble, tcx_trackpoint, tcx_postamble
-
-import matplotlib.pyplot as plt
-from matplotlib.gridspec import GridSpec
+import os, errno, time
 
-from postprocess import scan_data
+from course import CourseView
+from finalise import sweep
+from session import live_session, EMIT, SYNC
+from trackpoints import emission
+from telemetry import refresher, ease, hms, REFRESH
+from instrument import instrument
 
 class Piyak(BoxLayout):
 
     needle    = NumericProperty(0)
-    polyline  = ListProperty([])
     play_mode = NumericProperty(0)
 
     def __init__(self, **kwargs):
+        # the flywheel sensor is pigpio on the ergo unless another device is
+        # given, e.g. a recording being replayed (see replay.py) which isn't
+        # finalised as a real session. emit is the trackpoint emission policy
+        # (see trackpoints.py) and sync_interval the seconds between syncs of
+        # the dat file, chosen per deployment with PIYAK_EMIT and PIYAK_SYNC
+        device   = kwargs.pop('device', None)
+        finalise = kwargs.pop('finalise', True)
+        emit     = kwargs.pop('emit', EMIT)
+        sync     = kwargs.pop('sync_interval', SYNC)
+
         super(Piyak, self).__init__(**kwargs)
-        Clock.schedule_interval(self.update, 1./60.)
-
-        dtn = datetime.now()
-        self.time_start = dtn
-
-        GPIO_PIN    = 2
-        self.device = pigpio.pi()
-        self.pin    = gpio_pin(self.device, GPIO_PIN)
-
-        # this is the raw data of flywheel rotation periods
-        self.datfile = open('dat/{}.dat'.format(self.time_start.strftime("%Y%m%d%H%M")), 'w')
-
-        self.elapsed        = timedelta(0)
-        self.pin_delta      = deque([(1,0),(1,0),(1,0)], 3) # double ended queue = shift register 3 deep
-        self.pin_eventcount = 0
-        self.max_timestamp  = dtn
-        self.rot_ke_max     = 0.0                       # power calc requires a maximum...
-        self.rot_ke_min     = deque([0.0]*2, 2)         # ...and two minima
-        self.stroke         = deque([dtn]*2, 2)
-        self.energy_samp    = deque([0]*4, 4)
-        self.stroke_samp    = deque([0]*4, 4)
-        self.stroke_rate    = deque([0]*4, 4)
-
-        # course progress tracking
-        self.track, self.lap_distance = generate_track('gerono', 'waikiki')
-        self.trackptr   = 0
-        self.lap_count  = 0
-        self.timestamps = []
+
+        # with PIYAK_METRICS set every update is timed, see instrument.py
+        self.instrument = instrument() if os.environ.get('PIYAK_METRICS') else None
+        self.overlay    = None
+        if self.instrument is not None:
+            Clock.schedule_interval(self.timed_update, 1./60.)
+        else:
+            Clock.schedule_interval(self.update, 1./60.)
+
+        if device is None:
+            import pigpio
+            device = pigpio.pi()
+            if not device.connected:
+                raise RuntimeError("can't connect to pigpiod, is it running? (sudo pigpiod)")
+
+        self.session  = live_session(device, emit=emit, sync_interval=sync, instrument=self.instrument)
+        self.finalise = finalise
+
+        # the numbers on the display, and the widgets they go to at their own rates
+        self.needle_eased = 0.0
+        self.refresh = {'elapsed': refresher(self.ids.i_elapsed, 'text', hms,                           REFRESH['elapsed']),
+                        'speed':   refresher(self.ids.i_speed,   'text', '[b]{:04.1f}[/b]km/h'.format, REFRESH['speed']),
+                        'dist':    refresher(self.ids.i_dist,    'text', '[b]{:.0f}[/b]m'.format,      REFRESH['dist']),
+                        'power':   refresher(self.ids.i_power,   'text', '[b]{:.0f}[/b]W'.format,      REFRESH['power']),
+                        'stroke':  refresher(self.ids.i_stroke,  'text', '[b]{:.0f}[/b]dspm'.format,   REFRESH['stroke']),
+                        'needle':  refresher(self,               'needle', lambda a: round(a, 1),      REFRESH['needle'])}
+
+        self.ids.i_course.lap_points = len(self.session.track)
 
         self._keyboard = Window.request_keyboard(self._keyboard_closed, self)
         self._keyboard.bind(on_key_down=self._on_keyboard_down)
 
+        if self.instrument is not None:
+            self.overlay_cbf()
+
     def _keyboard_closed(self):
         self._keyboard.unbind(on_key_down=self._on_keyboard_down)
         self._keyboard = None
@@ -142,251 +139,105 @@ class Piyak(BoxLayout):
             self.reset_cbf()
         elif keycode[1] == 'spacebar':
             self.playpause_cbf()
+        elif keycode[1] == 'm' and self.instrument is not None:
+            self.overlay_cbf()
 
         return True
 
-    def update(self, *args):
-        # constants for the revoltion period shift register elements
-        NEW  = 2
-        PREV = NEW-1
-        OLD  = 0
-
-        def rot_ke(rotation_time):
-            # SI unit for moment of inertia is kg metres squared (not grammes)
-            # constants
-            mass   = 4.360  # mass of Lawler flywheel in kilogrammes (I weighed mine!)
-            radius = 0.200  # radius of Lawler flywheel in metres
-
-            period = rotation_time * 1e-6 # microseconds to seconds
-
-            # w  = 2*pi/period (angular velocity omega = 2 pi radians * revolutions/second)
-            # I  = 0.5*m*r^2 (half m radius squared)
-            # KE = 0.5*I*w^2 (half I omega squared)
-            # return mass*(radius*math.pi/period)**2
-
-            # precalc the numerator for speed
-            # return 1721259007550/(rotation_time * rotation_time)
-
-            # alternatively do the divide and return the square
-            t = 1311967.60918/rotation_time
-            return t**2
+    def timed_update(self, *args):
+        start = time.perf_counter()
+        self.update(*args)
+        self.instrument.tick(time.perf_counter() - start)
+        self.instrument.dropped = self.session.pin.dropped
+
+        if self.overlay is not None:
+            self.overlay_text.update(time.monotonic(), self.instrument)
+
+    def overlay_cbf(self):
+        # show or hide the instrumentation over the top of everything else
+        if self.overlay is None:
+            self.overlay = Label(size_hint=(None, None), size=(Window.width, 80),
+                                 pos=(0, Window.height - 80), halign='left', valign='top',
+                                 font_size=14, color=[0, 1, 0, 1])
+            self.overlay.text_size = self.overlay.size
+            self.overlay_text = refresher(self.overlay, 'text', instrument.text, REFRESH['overlay'])
+            Window.add_widget(self.overlay)
+        else:
+            Window.remove_widget(self.overlay)
+            self.overlay = None
 
+    def update(self, *args):
         if self.play_mode == 1:
-            time_now       = datetime.now()
-            self.elapsed  += time_now - self.time_last
-            self.time_last = time_now
+            points = self.session.update(time.monotonic())
+            m      = self.session.metrics
 
             # on a real system we need to update the elapsed time even if there
             # are no events accumulated yet because the user isn't ready
             #
-            hour, remr = divmod(self.elapsed.seconds, 60*60)
-            mins, secs = divmod(remr, 60)
-            self.ids.i_elapsed.text = "{:02d}:{:02d}:{:02d}".format(hour, mins, secs)
-
-            # only update the event queue when one has occurred (event count on the real I/O pin changes)
-            if self.pin_eventcount != self.pin._eventcount and self.pin._delta != None:
-                # shift in the new measured rotation period on every update, along with a timestamp
-                self.pin_delta.append((self.pin._delta, time_now))
-
-                # as above, but needs to be sensitive to event count changes
-                self.datfile.write("{}\n".format(int(self.pin_delta[NEW][0])))
-
-            self.pin_eventcount = self.pin._eventcount
-
-            if self.pin_delta[NEW][0] != None and self.pin_eventcount != 0:
-
-                # the GPIO pin timer clock is 1MHz <=> 1us period
-                # count hundreds of rpm, i.e. hrpm = 60*1E6/(100*delta)
-                hrpm = 600000.0 / self.pin_delta[NEW][0]
-                # using 750rpm = 11km/h as a model, km/h = rpm * 11/750
-                # then kph = 60*1E6/delta * 11/750 = 880000/delta
-                kph  = 880000.0 / self.pin_delta[NEW][0]     # 11km/h = 750rpm
-                # TCX files seem to like speed in m/s, so calculate that
-                mps  = 244444.4 / self.pin_delta[NEW][0]     # kph x 1000/(60*60)
-                # using 60 minutes * 750rpm = 11km, 1 rev = 11E3/(60*750) metres
-                # 1 rev = 11000/(60*750) = 11/45 = 0.2444m
-                dist = self.pin_eventcount * 0.2444444444
-
-                # look at the last three rotation measurements (NEW, PREV, OLD) to detect a local
-                # min or max (start and end of power phase)
-                if self.pin_delta[NEW][0] > self.pin_delta[PREV][0] and self.pin_delta[PREV][0] < self.pin_delta[OLD][0]:
-                    # slow -> fast -> slow makes PREV a local maximum
-                    self.rot_ke_max = rot_ke(self.pin_delta[PREV][0])
-                    self.max_timestamp = self.pin_delta[PREV][1]
-
-                elif self.pin_delta[NEW][0] < self.pin_delta[PREV][0] and self.pin_delta[PREV][0] > self.pin_delta[OLD][0]:
-                    # fast -> slow -> fast makes PREV a local minimum
-                    self.rot_ke_min.append(rot_ke(self.pin_delta[PREV][0]))
-                    self.stroke.append(self.pin_delta[PREV][1])
-
-                power_timedelta = self.max_timestamp - self.stroke[PREV]
-                setup_timedelta = self.stroke[PREV] - self.max_timestamp
-
-                tpower = power_timedelta.seconds + 1e-6*power_timedelta.microseconds
-                tsetup = power_timedelta.seconds + 1e-6*power_timedelta.microseconds
-
-                energy_in = 0
-                # this calculation is based upon my own analysis as given in report.py eqs (1) & (2)
-                if tsetup != 0: # check for zero divide
-                    energy_in = self.rot_ke_max - self.rot_ke_min[0] + tpower/tsetup * (self.rot_ke_max - self.rot_ke_min[1])
-
-                # update the telemetry based on the numbers
-                self.needle            = -22.5 * hrpm
-                self.ids.i_speed.text  = '[b]{:04.1f}[/b]km/h'.format(kph)
-                self.ids.i_dist.text   = '[b]{:.0f}[/b]m'.format(dist)
-
-                stroke_timedelta = self.stroke[1] - self.stroke[0] # the time between two local minima
-                stroke_period = stroke_timedelta.seconds + 1e-6*stroke_timedelta.microseconds
-
-                # stroke rate is 1 minute divided by the non-zero stroke period
-                if stroke_timedelta != timedelta(0):
-
-                    self.energy_samp.append(energy_in)
-                    self.stroke_samp.append(stroke_period)
-                    self.ids.i_power.text = '[b]{:.0f}[/b]W'.format(sum(self.energy_samp)/sum(self.stroke_samp))
-
-                    self.stroke_rate.append(30.0/stroke_period)
-                    self.ids.i_stroke.text = '[b]{:.0f}[/b]dspm'.format(sum(self.stroke_rate)/self.stroke_rate.maxlen)
-
-                # check progress along the track (course)
-                if dist > (self.track[self.trackptr]['dist'] + self.lap_count*self.lap_distance):
-                    self.timestamps.append({'time': time_now.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3], 'speed': mps, 'dist': dist})
-                    # let the trackpointer roll over and update the lap count
-                    self.polyline.append(self.track[self.trackptr]['x'])
-                    self.polyline.append(self.track[self.trackptr]['y'])
-                    self.lap_count, self.trackptr = divmod(len(self.timestamps), len(self.track))
+            now = time.monotonic()
+            self.refresh['elapsed'].update(now, m.elapsed)
+            self.refresh['power'].update(now, m.power)
+            self.refresh['stroke'].update(now, m.spm)
+
+            if m.moving:
+                # update the telemetry based on the numbers, the needle easing
+                # towards the latest period between flywheel revolutions
+                self.needle_eased = ease(self.needle_eased, m.needle, self.session.dt)
+                self.refresh['needle'].update(now, self.needle_eased)
+                self.refresh['speed'].update(now, m.kph)
+                self.refresh['dist'].update(now, m.dist)
+
+            if points:
+                self.ids.i_course.add_points(points)
 
     def playpause_cbf(self):
         if self.play_mode == 0:
             self.play_mode = 1
-            self.time_last = datetime.now()
+            self.session.start(time.monotonic())
         else:
             self.play_mode = 0
 
     def reset_cbf(self):
-        self.elapsed            = timedelta(0)
-        self.pin_delta          = deque([(0,timedelta(0)),(0,timedelta(0)),(0,timedelta(0))], 3)
-        self.pin_eventcount     = 0
+        self.session.reset()
         self.ids.i_speed.text   = '[b]0.0[/b]km/h'
         self.ids.i_dist.text    = '[b]0[/b]m'
         self.ids.i_elapsed.text = '00:00:00'
         self.ids.i_power.text   = '[b]0[/b]W'
         self.ids.i_stroke.text  = '[b]0[/b]dspm'
         self.needle             = 0.0
-        self.polyline           = []
-        self.trackptr           = 0
-        self.lap_count          = 0
-        self.timestamps         = []
-        self.time_start         = datetime.now()
+        self.needle_eased       = 0.0
+        for r in self.refresh.values():
+            r.reset()
+        self.ids.i_course.clear()
 
     def exit_cbf(self):
-        # exit cleanly by turning off the pin activities and stopping the device
-        self.pin.cancel()
-        self.device.stop()
-        self.datfile.close()
-
-        if self.elapsed.seconds > 0:
-
-            total_revs     = self.pin_eventcount
-            total_distance = self.pin_eventcount * 0.2444444444
-
-            # -------------------------------------------------------------------------
-            # the app has run, now generate the activity file in tcx format
-
-            session = self.time_start.strftime("%Y%m%d%H%M")
-
-            max_speed = 0
-            for x in self.timestamps:
-                if (x['speed'] > max_speed) and (x['speed'] >= 0) and (x['speed'] < 30):
-                    max_speed = x['speed']
-
-            calories  = 1000*self.elapsed.seconds/3600        # crude calc: 1000 calories/hour
-            elevation = 0
-            heartrate = 150
-
-            average_speed = total_distance / self.elapsed.seconds
-
-            time_start_str = self.time_start.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] # format for tcx file
-
-            activity = open('activities/activity_{}.tcx'.format(session), 'w')
-            activity.write(tcx_preamble.format(time_start_str,
-                                               time_start_str,
-                                               self.elapsed.seconds,
-                                               total_distance,
-                                               max_speed,
-                                               calories))
-
-            for tp in range(len(self.timestamps)): # loop over all trackpoints reached
-                activity.write(tcx_trackpoint.format(self.timestamps[tp]['time'],
-                               self.track[tp%len(self.track)]['lat'],
-                               self.track[tp%len(self.track)]['lon'],
-                               elevation,
-                               self.timestamps[tp]['dist'],
-                               heartrate,
-                               self.timestamps[tp]['speed']))
-
-            activity.write(tcx_postamble.format(average_speed))
-            activity.close()
-
-            print("Total distance: {}".format(total_distance))
-            hour, remr = divmod(self.elapsed.seconds, 60*60)
-            mins, secs = divmod(remr, 60)
-            print("Total time: {:02d}:{:02d}:{:02d}".format(hour, mins, secs))
-            print("Average speed: {}".format(average_speed))
-            print("Total revs: {}".format(total_revs))
-            print("Lap length: {}".format(self.lap_distance))
-            print("Total laps: {}".format(total_distance/self.lap_distance))
-            print("File: {}".format('activities/activity_{}.tcx'.format(session)))
-
-            # -------------------------------------------------------------------------
-            # now read in the full detail from the session dat file and post-process it
-
-            energy, rpm, power, stroke, power_a, power_b = scan_data(session)
-
-            xlabel    = 'Time (seconds)'
-            xtitle    = 'Session: {}'.format(session)
-            rpm_label = 'Revolutions\n(per minute)'
-            eny_label = 'Rotational\nEnergy\n(joules)'
-            pwr_label = 'Power\n(watts)'
-            stk_label = 'Double Strokes\n(per minute)'
-
-            fig, (rpm_axes, eny_axes, pwr_axes, stk_axes) = plt.subplots(4, sharex=True)
-
-            x, y = zip(*rpm)
-            rpm_dots, = rpm_axes.plot(x, y, 'green', marker='.', label='samples')
-            rpm_axes.grid(visible=True)
-            rpm_axes.set_ylabel(rpm_label)
-
-            x, y = zip(*energy)
-            eny_line, = eny_axes.plot(x, y, 'blue', label='line')
-            eny_axes.grid(visible=True)
-            eny_axes.set_ylabel(eny_label)
-
-            x, y = zip(*power)
-            pwr_axes.plot(x, y, color='orange')
-            pwr_axes.grid(visible=True)
-            pwr_axes.set_ylabel(pwr_label)
-
-            x, y = zip(*stroke)
-            stk_axes.plot(x, y, color='gray')
-            stk_axes.grid(visible=True)
-            stk_axes.set_ylabel(stk_label)
+        self.session.close(self.finalise)
+        if not self.finalise:
+            self.session.discard()      # a replay, not a real session
+        App.get_running_app().stop()
 
-            rpm_axes.set_title(xtitle)
-            stk_axes.set_xlabel(xlabel)
+class PiyakApp(App):
+    def __init__(self, **kwargs):
+        # these go to Piyak, e.g. the device when replaying a recording
+        self.piyak_kwargs = {k: kwargs.pop(k) for k in ('device', 'finalise', 'emit', 'sync_interval') if k in kwargs}
+        super(PiyakApp, self).__init__(**kwargs)
 
-            plt.tight_layout()
+    def build(self):
+        root = Piyak(**self.piyak_kwargs)
 
-            fig.savefig("activities/" + session + ".png")
-            #plt.show()
-            plt.close(fig)
+        # startup benchmark: report when the first frame is on the screen and
+        # leave without keeping the empty session
+        if os.environ.get('PIYAK_FIRST_FRAME'):
+            def first_frame(*args):
+                Window.unbind(on_flip=first_frame)
+                print("PIYAK_FIRST_FRAME {:.6f}".format(time.time()))
+                root.session.close(finalise=False)
+                root.session.discard()
+                self.stop()
 
+            Window.bind(on_flip=first_frame)
 
-        App.get_running_app().stop()
-
-class PiyakApp(App):
-    def build(self):
-        return Piyak()
+        return root
 
 if __name__ == "__main__":
 
@@ -403,4 +254,16 @@ if __name__ == "__main__":
         if err.errno != errno.EEXIST:
             raise
 
-    PiyakApp().run()
+    # finish off any earlier session that was interrupted while being finalised
+    sweep()
+
+    # trackpoints to the activity: 'trackpoint' (every one), '<N>s' or '<N>m'
+    emit = os.environ.get('PIYAK_EMIT', EMIT)
+    emission(emit)                  # a bad policy stops here, not mid session
+
+    # seconds of the dat file a crash or power cut can lose, see datfile.py
+    sync_interval = float(os.environ.get('PIYAK_SYNC', SYNC))
+    if sync_interval <= 0:
+        raise ValueError("PIYAK_SYNC must be a positive number of seconds, not {!r}".format(sync_interval))
+
+    PiyakApp(emit=emit, sync_interval=sync_interval).run()
@@ -46,39 +46,82 @@ THE SOFTWARE.
 # mass (to weigh it, you will have to dismantle your machine - a bit :)
 
 import sys
-import math
-import matplotlib.pyplot as plt
+import datfile
 
-def scan_data(session):
+from strokes import MASS, RADIUS, rot_ke, stroke_power, turning_points
+
+def session_path(session):
+    # either a session datestamp or the path of its dat file
+    if session.endswith('.dat'):
+        return session
+    return "dat/" + session + ".dat"
+
+def flywheel(session):
+    # the flywheel constants a session was recorded with. Legacy text sessions
+    # predate the header and were all recorded on the Lawler flywheel.
+    path = session_path(session)
+    if datfile.is_binary(path):
+        header = datfile.read_header(path)
+        return header['mass'], header['radius']
+    return MASS, RADIUS
+
+def read_periods(session):
+    # the session periods as integers plus the flywheel it was recorded on
+    import numpy as np
+
+    header, periods = datfile.read_periods(session_path(session))
+
+    if header is None:
+        header = {'mass': MASS, 'radius': RADIUS}
+
+    # zero periods carry no information
+    periods = periods.astype(np.int64)
+    periods = periods[periods != 0]
+
+    return header, periods
 
-    # SI unit for moment of inertia is kg metres squared (not grammes)
-    MASS   = 4.360  # mass of Lawler flywheel in kilogrammes
-    RADIUS = 0.200  # radius of Lawler flywheel in metres
-    PI     = math.pi
+def pull_power(ts, energy, i1, i2, air_resistance):
+    # instantaneous power through the pull of each stroke, from the catch at
+    # t1 to the end of the pull at t2, with zero power either side
+    import numpy as np
 
-    energy = []
-    rpm = []
+    n     = i2 - i1                  # samples after t1 up to and including t2
+    size  = n + 2
+    start = np.cumsum(size) - size   # where each stroke begins in the output
 
-    ts = 0
+    x = np.empty(size.sum())
+    y = np.zeros(size.sum())
 
-    for usec in open("dat/" + session + ".dat"):
-        period = int(usec)*1.0e-6
-        if period != 0.0:
-            ts += period
+    x[start]       = ts[i1]
+    x[start+n+1]   = ts[i2]
 
-            # current rotation period to frequency in rpm
-            rpm.append((ts, 60.0/period))
+    stroke = np.repeat(np.arange(len(n)), n)
+    offset = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n) + 1
 
-            # w  = 2*pi/period (angular velocity omega = 2 pi radians * revolutions/second)
-            # I  = 0.5*m*r^2 (half m radius squared)
-            # KE = 0.5*I*w^2 (half I omega squared)
-            # energy.append((ts, MASS*(RADIUS*PI/period)**2))
+    sample = i1[stroke] + offset
+    t1     = ts[i1][stroke]
+    e1     = energy[i1][stroke]
 
-            # precalc energy numerator
-            # energy.append((ts, 1721259007550/(int(usec) * int(usec))))
+    x[start[stroke] + offset] = ts[sample]
+    y[start[stroke] + offset] = ((energy[sample] - e1) + air_resistance[stroke]*(ts[sample] - t1)) / (ts[i2] - ts[i1])[stroke]
 
-            t = 1311967.60918/int(usec) # alternative uses a square calc
-            energy.append((ts, t**2))
+    return x, y
+
+def scan_session(session):
+    # timestamps, energy and rpm of every revolution, the index of every
+    # turning point and the stroke table. numpy is imported on first use,
+    # not when postprocess is
+    import numpy as np
+
+    header, periods = read_periods(session)
+
+    # timestamps are the running total of the rotation periods
+    ts = np.cumsum(periods*1.0e-6)
+
+    # current rotation period to frequency in rpm
+    rpm = 60.0/(periods*1.0e-6)
+
+    energy = rot_ke(periods, header['mass'], header['radius'])
 
     '''
     Identify Individual Strokes
@@ -167,70 +210,78 @@ def scan_data(session):
 
     '''
 
-    power   = []
-    power_a = []
-    power_b = []
-    stroke  = []
-
-    LOOKING_FOR_E1 = True     # start here in hunt for first local minimum
-    LOOKING_FOR_E2 = False    # then alternate between this state and the next
-    LOOKING_FOR_E3 = False
-
-    ab_sel = 0
-
-    for ii, tup in enumerate(energy[:-1]): # loop over all ii, ii+1 pairs
-
-        if LOOKING_FOR_E1 and tup[1] < energy[ii+1][1]:
-            leading_edge = [tup]
-
-            power.append(tup)
-            stroke.append(tup)
-
-            LOOKING_FOR_E1 = False
-            LOOKING_FOR_E2 = True
-
-        elif LOOKING_FOR_E2:
-            leading_edge.append(tup)
-
-            if tup[1] > energy[ii+1][1]:
-                LOOKING_FOR_E2 = False
-                LOOKING_FOR_E3 = True
-
-        elif LOOKING_FOR_E3 and tup[1] < energy[ii+1][1]:
-            (t1, e1) = leading_edge[0]
-            (t2, e2) = leading_edge[len(leading_edge)-1]
-            (t3, e3) = tup
-
-            # we're at E3 in the data, so calculate the power for this stroke
-            air_resistance = (e2-e3)/(t3-t2)
-
-            pwr_over_stroke = (e2-e1 + air_resistance*(t2-t1)) / (t3-t1) # eqs.(1,2)
-            pwr_over_pull = (e2-e1 + air_resistance*(t2-t1)) / (t2-t1) # eqs.(1,2)
-
-            power.append((t2, pwr_over_stroke))
-            stroke.append((t2, 30.0/(t3-t1))) # double strokes/min = strokes/30s
-
-            if ab_sel==0:
-                power_a.append((t1, 0))
-                for jj, le_sample in enumerate(leading_edge[:-1]):
-                    curr_ts, curr_en = leading_edge[jj+1]
-                    inst_pwr = ((curr_en - e1) + air_resistance*(curr_ts - t1))/(t2 - t1)
-                    power_a.append((curr_ts, inst_pwr))
-                #power_a.append((t2, pwr_over_pull))
-                power_a.append((t2, 0))
-                ab_sel = 1
-            else:
-                power_b.append((t1, 0))
-                for jj, le_sample in enumerate(leading_edge[:-1]):
-                    curr_ts, curr_en = leading_edge[jj+1]
-                    inst_pwr = ((curr_en - e1) + air_resistance*(curr_ts - t1))/(t2 - t1)
-                    power_b.append((curr_ts, inst_pwr))
-                #power_b.append((t2, pwr_over_pull))
-                power_b.append((t2, 0))
-                ab_sel = 0
-
-            leading_edge = [tup] # e3 is the next e1
-            LOOKING_FOR_E2 = True
-            LOOKING_FOR_E3 = False
-
-    return energy, rpm, power, stroke, power_a, power_b
+    turns   = turning_points(periods)
+    strokes = stroke_table(ts, energy, turns)
+
+    return ts, energy, rpm, turns, strokes
+
+# one record per stroke: the indices, times and energies of its E1, E2 and
+# E3, the air resistance and power of equations (1) and (2), the mean power
+# over the pull (t1 to t2) and the side, 0 (A) or 1 (B)
+STROKE_FIELDS = [('side', 'u1'),
+                 ('n1', 'i8'), ('n2', 'i8'), ('n3', 'i8'),
+                 ('t1', 'f8'), ('t2', 'f8'), ('t3', 'f8'),
+                 ('e1', 'f8'), ('e2', 'f8'), ('e3', 'f8'),
+                 ('air_resistance', 'f8'), ('power', 'f8'), ('pull', 'f8')]
+
+def stroke_table(ts, energy, turns):
+    import numpy as np
+
+    # every E3 is the E1 of the next stroke
+    count   = max(0, (len(turns)-1)//2)
+    strokes = np.zeros(count, dtype=STROKE_FIELDS)
+    if count == 0:
+        return strokes
+
+    i1 = turns[0:2*count:2]
+    i2 = turns[1:2*count:2]
+    i3 = turns[2:2*count+1:2]
+
+    t1, t2, t3 = ts[i1], ts[i2], ts[i3]
+    e1, e2, e3 = energy[i1], energy[i2], energy[i3]
+
+    air_resistance, pwr_over_stroke = stroke_power(t1, t2, t3, e1, e2, e3) # eqs.(1,2)
+
+    # strokes alternate between sides A and B
+    strokes['side'] = np.arange(count) % 2
+    strokes['n1'], strokes['n2'], strokes['n3'] = i1, i2, i3
+    strokes['t1'], strokes['t2'], strokes['t3'] = t1, t2, t3
+    strokes['e1'], strokes['e2'], strokes['e3'] = e1, e2, e3
+    strokes['air_resistance'] = air_resistance
+    strokes['power']          = pwr_over_stroke
+    strokes['pull']           = ((e2 - e1) + air_resistance*(t2 - t1)) / (t2 - t1)
+
+    return strokes
+
+def stroke_series(ts, energy, turns, strokes):
+    # power, stroke rate and the pull power of each side as (x, y) arrays,
+    # all derived from the stroke table
+    import numpy as np
+
+    if len(turns) == 0:
+        empty = (np.empty(0), np.empty(0))
+        return empty, empty, empty, empty
+
+    # the first minimum starts both series off
+    t2     = strokes['t2']
+    power  = (np.append(ts[turns[0]], t2), np.append(energy[turns[0]], strokes['power']))
+    stroke = (np.append(ts[turns[0]], t2), np.append(energy[turns[0]], 30.0/(strokes['t3']-strokes['t1']))) # double strokes/min = strokes/30s
+
+    a = strokes[strokes['side'] == 0]
+    b = strokes[strokes['side'] == 1]
+    power_a = pull_power(ts, energy, a['n1'], a['n2'], a['air_resistance'])
+    power_b = pull_power(ts, energy, b['n1'], b['n2'], b['air_resistance'])
+
+    return power, stroke, power_a, power_b
+
+def scan_arrays(session):
+    ts, energy, rpm, turns, strokes = scan_session(session)
+    return ((ts, energy), (ts, rpm)) + stroke_series(ts, energy, turns, strokes)
+
+def scan_strokes(session):
+    # the stroke table alone, a NumPy record array of STROKE_FIELDS
+    return scan_session(session)[-1]
+
+def scan_data(session):
+    # the same series as scan_arrays() as lists of (time, value) tuples
+    return tuple(list(zip(x.tolist(), y.tolist())) for x, y in scan_arrays(session))
@@ -0,0 +1,106 @@
+'''
+// ---------------------------------------------------------------------------
+//
+//                                      ,`\
+//  L                              ...    /  M   M             k
+//  L      ooo   ggg  i  ccc     @ o o @.'   M\ /M  ooo  n nn  k k   ee  y   y
+//  L     o   o g   g . c      .' ( o )      M V M o   o n'  n kk   e__e y   y
+//  L     o   o g   g i c     /  (     )     M   M o   o n   n k k  e    y   y
+//  LLLLL  ooo   gggg i  ccc  \.' \ : /      M   M  ooo  n   n K  k  ee'  yyyy
+//                  g            nnn nnn                                    y
+//                gg                                                     yyy
+//
+// ------------------------------------------------------=--------------------
+//
+// Piyak - a program to monitor and log the effort on a kayak ergo.
+//
+// Copyright (c) 2017-24 Piers Barber   piers.barber@logicmonkey.co.uk
+//
+// ------------------------------------------------------=--------------------
+
+This is free software released under the terms of the MIT licence
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+'''
+Mean-Maximal Power
+
+The power-duration curve of a session: for every window length from
+SHORTEST to LONGEST seconds, the best average power held over any window
+of that length. Each stroke puts in its power of eq.(2) from its E1 to the
+next (t1 to t3, see postprocess.stroke_table) and strokes follow on from
+one another, so the energy put in up to any time is a running total of
+power times stroke duration, linear within a stroke.
+
+That running total is sampled once a second, which makes the mean power of
+every window of w seconds (E[i+w] - E[i])/w: one vectorised pass per window
+length instead of a sum over every window. Windows start on whole seconds
+from the first stroke. Windows longer than the session have no power.
+
+Per-session curves are kept in the session store (see store.py), so a new
+session costs one curve, and the all-time curve is their envelope, the best
+of any session at each window length.
+'''
+
+SHORTEST = 10                # seconds
+LONGEST  = 60*60
+
+# durations shown when the whole curve is too much
+REPORT = (10, 30, 60, 2*60, 5*60, 10*60, 20*60, 30*60, 60*60)
+
+def durations():
+    import numpy as np
+    return np.arange(SHORTEST, LONGEST+1)
+
+def energy_samples(strokes):
+    # the energy put in up to each whole second from the first stroke's t1
+    import numpy as np
+
+    if len(strokes) == 0:
+        return np.zeros(1)
+
+    t1, t3 = strokes['t1'], strokes['t3']
+    bounds = np.append(t1[0], t3)
+    total  = np.append(0.0, np.cumsum(strokes['power']*(t3 - t1)))
+
+    seconds = np.arange(0, int(bounds[-1] - bounds[0]) + 1)
+    return np.interp(bounds[0] + seconds, bounds, total)
+
+def mean_maximal(strokes, lengths=None):
+    # best mean power for each window length, NaN where longer than the session
+    import numpy as np
+
+    if lengths is None:
+        lengths = durations()
+
+    energy = energy_samples(strokes)
+    power  = np.full(len(lengths), np.nan)
+
+    for k, w in enumerate(lengths):
+        if w >= len(energy):
+            break
+        power[k] = (energy[w:] - energy[:-w]).max()/w
+
+    return power
+
+def duration_text(seconds):
+    if seconds % 60:
+        return '{}s'.format(seconds)
+    return '{}m'.format(seconds//60)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+'''
+// ---------------------------------------------------------------------------
+//
+//                                      ,`\
+//  L                              ...    /  M   M             k
+//  L      ooo   ggg  i  ccc     @ o o @.'   M\ /M  ooo  n nn  k k   ee  y   y
+//  L     o   o g   g . c      .' ( o )      M V M o   o n'  n kk   e__e y   y
+//  L     o   o g   g i c     /  (     )     M   M o   o n   n k k  e    y   y
+//  LLLLL  ooo   gggg i  ccc  \.' \ : /      M   M  ooo  n   n K  k  ee'  yyyy
+//                  g            nnn nnn                                    y
+//                gg                                                     yyy
+//
+// ------------------------------------------------------=--------------------
+//
+// Piyak - a program to monitor and log the effort on a kayak ergo.
+//
+// Copyright (c) 2017-24 Piers Barber   piers.barber@logicmonkey.co.uk
+//
+// ------------------------------------------------------=--------------------
+
+This is free software released under the terms of the MIT licence
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+'''
+Session Query
+
+Questions across every session, answered from the session store (see
+store.py) rather than by rescanning the dat files. The store is brought up
+to date first, which only processes dat files that are new or changed, so
+the first run takes as long as a batch summary and later ones are quick.
+
+  Usage:
+    query.py [--since YYYY-MM-DD] [--until YYYY-MM-DD] [-m minutes]
+             [--sort date|duration|power] [-l limit]
+    query.py --balance [month|year] [--since ...] [--until ...]
+    query.py --curve [<activitydate>] [--full] [--since ...] [--until ...]
+    query.py --sql "SELECT ..."
+    query.py -u                             (update the store only)
+'''
+
+import sys
+import glob
+import os
+import argparse
+
+from store import STORE, connect, update
+from powercurve import REPORT, duration_text
+
+DAT_DIR = 'dat'
+
+SORT = {'date':     'start',
+        'duration': 'duration DESC',
+        'power':    'power DESC'}
+
+PERIOD = {'month': 7,        # 'YYYY-MM'
+          'year':  4}        # 'YYYY'
+
+def where(since, until, minutes=None, column='start'):
+    # the WHERE clause and its parameters for a date range and minimum duration
+    terms, params = [], []
+    if since:
+        terms.append(column + ' >= ?')
+        params.append(since)
+    if until:
+        # until is inclusive of the whole day
+        terms.append(column + ' < date(?, \'+1 day\')')
+        params.append(until)
+    if minutes:
+        terms.append('duration >= ?')
+        params.append(60.0*minutes)
+    return (' WHERE ' + ' AND '.join(terms)) if terms else '', params
+
+def list_sessions(db, since=None, until=None, minutes=None, sort='date', limit=None):
+    clause, params = where(since, until, minutes)
+    query = 'SELECT session, duration, strokes, power, power_a, power_b, rate FROM sessions' + clause
+    query += ' ORDER BY ' + SORT[sort]
+    if limit:
+        query += ' LIMIT ?'
+        params.append(limit)
+    return db.execute(query, params).fetchall()
+
+def balance(db, period='month', since=None, until=None):
+    # mean pull power of each side per period, over every stroke in it
+    clause, params = where(since, until)
+    query = '''SELECT substr(start, 1, {}) AS period,
+                      AVG(CASE WHEN side = 0 THEN pull END),
+                      AVG(CASE WHEN side = 1 THEN pull END),
+                      COUNT(*)
+               FROM strokes JOIN sessions USING (session){}
+               GROUP BY period ORDER BY period'''.format(PERIOD[period], clause)
+    return db.execute(query, params).fetchall()
+
+def power_curve(db, session=None, since=None, until=None, full=False):
+    # the mean-maximal power curve of one session, or the envelope of every
+    # session in the date range, with the session that set each point
+    clause, params = where(since, until)
+    if session:
+        clause, params = ' WHERE session = ?', [session]
+    if not full:
+        clause += (' AND ' if clause else ' WHERE ') + 'seconds IN ({})'.format(', '.join('?'*len(REPORT)))
+        params += list(REPORT)
+
+    # SQLite takes the bare session column from the row holding the MAX()
+    query = '''SELECT seconds, MAX(power_curve.power), session
+               FROM power_curve JOIN sessions USING (session){}
+               GROUP BY seconds ORDER BY seconds'''.format(clause)
+    return db.execute(query, params).fetchall()
+
+def write_sessions(rows, output):
+    output.write("Session, Duration h, Strokes, Power W, Pull A W, Pull B W, Rate dspm\n")
+    for session, duration, strokes, power, power_a, power_b, rate in rows:
+        output.write("{}, {:.2f}, {}, {}, {}, {}, {}\n".format(session, duration/3600.0, strokes,
+                     *[value if value is None else round(value, 1) for value in (power, power_a, power_b, rate)]))
+
+def write_balance(rows, output):
+    output.write("Period, Pull A W, Pull B W, A/B, Strokes\n")
+    for period, pull_a, pull_b, strokes in rows:
+        ratio = pull_a/pull_b if pull_a and pull_b else None
+        output.write("{}, {:.1f}, {:.1f}, {:.3f}, {}\n".format(period, pull_a or 0.0, pull_b or 0.0, ratio or 0.0, strokes))
+
+def write_curve(rows, output):
+    output.write("Duration, Power W, Session\n")
+    for seconds, power, session in rows:
+        output.write("{}, {:.1f}, {}\n".format(duration_text(seconds), power, session))
+
+if __name__ == '__main__' :
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--dat",       type=str, default=DAT_DIR, help="Directory of session dat files")
+    parser.add_argument("--db",              type=str, default=STORE, help="Session store")
+    parser.add_argument("-u", "--update",    action="store_true", help="Update the store and stop")
+    parser.add_argument("-N", "--no-update", action="store_true", help="Query the store as it is")
+    parser.add_argument("-n", "--no-cache",  action="store_true", help="Recalculate instead of using cached results")
+    parser.add_argument("--since",           type=str, help="First date, YYYY-MM-DD")
+    parser.add_argument("--until",           type=str, help="Last date, YYYY-MM-DD")
+    parser.add_argument("-m", "--minutes",   type=float, help="Minimum session duration in minutes")
+    parser.add_argument("--sort",            choices=sorted(SORT), default='date', help="Session order")
+    parser.add_argument("-l", "--limit",     type=int, help="Most sessions to list")
+    parser.add_argument("--balance",         nargs='?', const='month', choices=sorted(PERIOD), help="Left/right pull power by month or year")
+    parser.add_argument("--curve",           nargs='?', const='', help="Mean-maximal power of a session, or the best of all sessions")
+    parser.add_argument("--full",            action="store_true", help="Every window length of the curve, not just the usual ones")
+    parser.add_argument("--sql",             type=str, help="Run a query of your own")
+    args = parser.parse_args()
+
+    db = connect(args.db)
+
+    if not args.no_update:
+        sessions, removed = update(db, sorted(glob.glob(os.path.join(args.dat, '*.dat'))), not args.no_cache)
+        if sessions or removed or args.update:
+            sys.stderr.write("{} sessions indexed, {} removed\n".format(len(sessions), removed))
+    if args.update:
+        sys.exit(0)
+
+    if args.sql:
+        cursor = db.execute(args.sql)
+        if cursor.description:
+            sys.stdout.write(', '.join(column[0] for column in cursor.description) + '\n')
+        for row in cursor:
+            sys.stdout.write(', '.join(str(value) for value in row) + '\n')
+    elif args.curve is not None:
+        write_curve(power_curve(db, args.curve, args.since, args.until, args.full), sys.stdout)
+    elif args.balance:
+        write_balance(balance(db, args.balance, args.since, args.until), sys.stdout)
+    else:
+        write_sessions(list_sessions(db, args.since, args.until, args.minutes, args.sort, args.limit), sys.stdout)
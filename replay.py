@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+'''
+// ---------------------------------------------------------------------------
+//
+//                                      ,`\
+//  L                              ...    /  M   M             k
+//  L      ooo   ggg  i  ccc     @ o o @.'   M\ /M  ooo  n nn  k k   ee  y   y
+//  L     o   o g   g . c      .' ( o )      M V M o   o n'  n kk   e__e y   y
+//  L     o   o g   g i c     /  (     )     M   M o   o n   n k k  e    y   y
+//  LLLLL  ooo   gggg i  ccc  \.' \ : /      M   M  ooo  n   n K  k  ee'  yyyy
+//                  g            nnn nnn                                    y
+//                gg                                                     yyy
+//
+// ------------------------------------------------------=--------------------
+//
+// Piyak - a program to monitor and log the effort on a kayak ergo.
+//
+// Copyright (c) 2017-24 Piers Barber   piers.barber@logicmonkey.co.uk
+//
+// ------------------------------------------------------=--------------------
+
+This is free software released under the terms of the MIT licence
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+'''
+Replay
+
+Plays a recorded session through the live app, so the capture path and the
+display can be run, load tested and regression tested on any Linux box with
+real sessions rather than a Raspberry Pi and an ergo.
+
+The device is fake_pigpio.pi() fed with the recorded periods, so gpio_pin
+gets rising edge callbacks with microsecond ticks just as on the ergo. In
+the app it runs on a thread of its own at real time or N times that, as the
+pigpio callback thread would. Headless, it is stepped frame by frame.
+
+  ./replay.py dat/201806121825.dat             the live app, in real time
+  ./replay.py -s 10 dat/201806121825.dat       ten times faster
+  ./replay.py --headless dat/201806121825.dat  no window, as fast as possible
+  ./replay.py --headless -r 60 dat/201806121825.dat   and reset after a minute
+
+Headless replay runs the live session code (session.py) on a simulated 60Hz
+clock and checks that every period replayed made it through the pin, the
+ring buffer and the dat writer unchanged, that the session counted every
+edge since it was last reset and that the trackpoint times in the activity
+strictly increase. It exits non-zero if not, for CI.
+'''
+
+import os
+import sys
+import time
+import tempfile
+
+import fake_pigpio
+
+def headless(periods, speed=0, rate=60, emit='trackpoint', instrument=None, reset_at=None):
+    # replay through the live session without a window, on a simulated clock
+    # of rate updates a second. speed 0 is as fast as possible. reset_at is
+    # seconds into the replay to press reset, as the r key does. Returns the
+    # session, its directory and how many edges there were before the reset
+    from session import live_session
+
+    tmp    = tempfile.mkdtemp()
+    device = fake_pigpio.pi(periods)
+    sess   = live_session(device, path=os.path.join(tmp, 'replay.dat'), activities=tmp, emit=emit, instrument=instrument)
+
+    frame = 1.0/rate
+    sess.start(0.0)
+    before = 0
+
+    ticks = 0
+    while not device.finished:
+        ticks += 1
+        device.advance(int(1e6 * frame * ticks))
+        now = frame * ticks
+
+        start = time.perf_counter()
+        sess.update(now)
+        if instrument is not None:
+            instrument.tick(time.perf_counter() - start)
+
+        if reset_at is not None and now >= reset_at:
+            sess.reset()
+            before   = device.edges
+            reset_at = None
+
+        if speed:
+            time.sleep(frame/speed)
+
+    sess.update(now + frame)     # whatever came with the last edge
+    sess.close(finalise=False)
+    return sess, tmp, before
+
+def play(device, speed=1.0, finalise=False):
+    # the live app itself, with the device started as soon as the app is
+    # and stopped when it runs out
+    from kivy.clock import Clock
+    from piyak import PiyakApp
+
+    for d in ('activities', 'dat'):
+        os.makedirs(d, exist_ok=True)
+
+    app = PiyakApp(device=device, finalise=finalise)
+
+    def started(dt):
+        app.root.playpause_cbf()
+        device.start(speed)
+
+    def finished(dt):
+        if device.finished:
+            app.root.exit_cbf()
+            return False
+
+    Clock.schedule_once(started, 0)
+    Clock.schedule_interval(finished, 0.5)
+    app.run()
+
+if __name__ == '__main__' :
+
+    import re
+    import argparse
+    import shutil
+    import datfile
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("session", help="Session dat file to replay")
+    parser.add_argument("-s", '--speed',    type=float, default=None, help="Times real time (default 1, or as fast as possible headless)")
+    parser.add_argument("--headless",       action="store_true", help="No window, check the capture path and exit")
+    parser.add_argument("-e", '--emit',     default='trackpoint', help="Trackpoint emission policy headless: trackpoint, <N>s or <N>m")
+    parser.add_argument("-r", '--reset',    type=float, default=None, help="Headless, reset the session this many seconds in")
+    parser.add_argument("-k", '--keep',     action="store_true", help="Keep the session and finalise it as a real one")
+    args = parser.parse_args()
+
+    periods = fake_pigpio.dat_periods(args.session)
+
+    if not args.headless:
+        play(fake_pigpio.pi(periods), args.speed or 1.0, args.keep)
+        sys.exit(0)
+
+    instrument = None
+    if os.environ.get('PIYAK_METRICS'):
+        from instrument import instrument
+        instrument = instrument()
+
+    t0 = time.perf_counter()
+    sess, tmp, before = headless(periods, args.speed or 0, emit=args.emit, instrument=instrument, reset_at=args.reset)
+    wall = time.perf_counter() - t0
+
+    replayed = [int(p) for p in datfile.read_periods(sess.datfile.path)[1]]
+    with open(sess.tcx_path) as activity:
+        times = re.findall(r'<Time>(.*?)</Time>', activity.read())
+    shutil.rmtree(tmp)
+
+    # every edge since the last reset, one more than the periods after it
+    edges = len(periods) + 1 - before
+
+    m = sess.metrics
+    print("{}: {} periods in {:.2f}s, {:.0f} periods/s".format(args.session, len(periods), wall, len(periods)/max(wall, 1e-9)))
+    print("Distance {:.0f}m, {} trackpoints, {} dropped".format(m.dist, sess.policy.count, sess.pin.dropped))
+
+    if replayed != periods or m.eventcount != edges:
+        print("FAIL: {} periods in, {} out, {} edges counted of {}".format(len(periods), len(replayed), m.eventcount, edges))
+        sys.exit(1)
+    if any(later <= earlier for earlier, later in zip(times, times[1:])):
+        print("FAIL: trackpoint times in the activity don't strictly increase")
+        sys.exit(1)
+    print("OK")
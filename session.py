@@ -0,0 +1,268 @@
+'''
+// ---------------------------------------------------------------------------
+//
+//                                      ,`\
+//  L                              ...    /  M   M             k
+//  L      ooo   ggg  i  ccc     @ o o @.'   M\ /M  ooo  n nn  k k   ee  y   y
+//  L     o   o g   g . c      .' ( o )      M V M o   o n'  n kk   e__e y   y
+//  L     o   o g   g i c     /  (     )     M   M o   o n   n k k  e    y   y
+//  LLLLL  ooo   gggg i  ccc  \.' \ : /      M   M  ooo  n   n K  k  ee'  yyyy
+//                  g            nnn nnn                                    y
+//                gg                                                     yyy
+//
+// ------------------------------------------------------=--------------------
+//
+// Piyak - a program to monitor and log the effort on a kayak ergo.
+//
+// Copyright (c) 2017-24 Piers Barber   piers.barber@logicmonkey.co.uk
+//
+// ------------------------------------------------------=--------------------
+
+This is free software released under the terms of the MIT licence
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+'''
+Live Session
+
+Everything the live app does with the flywheel that isn't drawing it: the
+pin capture, the dat file, the telemetry and progress around the course, the
+TCX activity, and handing the session over to be finalised at the end. Piyak owns one of
+these and only puts its numbers on the screen, so replay.py can run the very
+same session code with no window at all.
+
+The device is pigpio.pi() on the ergo, or anything with the same methods
+(see fake_pigpio.py) to drive the session from a recording.
+
+All the timing of the flywheel runs on the integer microsecond pigpio ticks
+of the edges themselves, drained from the pin into buffers allocated once
+here. Stroke and power timings come from the periods, and trackpoints are
+timed by the edge that reached them, so none of them carry the jitter of the
+display frame they were handled in. The wall clock is only used for the
+elapsed time on the display and to put dates on the session.
+'''
+
+import os
+from array import array
+from datetime import datetime
+
+from gpio_pin import gpio_pin
+from generate_track import generate_track
+from finalise import write_pending, launch, ACTIVITIES
+from datfile import session_writer
+from strokes import MASS, RADIUS
+from telemetry import telemetry, hms
+from tcx import tcx_writer
+from trackpoints import emission_policy
+
+GPIO_PIN   = 2
+QUEUE_SIZE = 4096                         # periods, over 4 minutes at 1000rpm
+COURSE     = ('gerono', 'waikiki', 500)   # curve, location, resolution
+EMIT       = 'trackpoint'                 # default trackpoint emission policy, see trackpoints.py
+SYNC       = 5.0                          # default seconds between dat file syncs, see datfile.py
+
+class live_session:
+    def __init__(self, device, course=COURSE, time_start=None, path=None, activities=ACTIVITIES, emit=EMIT, sync_interval=SYNC, instrument=None):
+        self.time_start = time_start if time_start is not None else datetime.now()
+        self.time_last  = None  # monotonic seconds of the last update
+        self.dt         = 0.0
+
+        self.device = device
+        self.pin    = gpio_pin(self.device, GPIO_PIN, QUEUE_SIZE)
+
+        # drained edge ticks and periods, and the microseconds from the start
+        # of the session to the newest edge (unwrapped, the ticks wrap at 32 bits)
+        self._ticks     = array('L', [0]) * QUEUE_SIZE
+        self._periods   = array('L', [0]) * QUEUE_SIZE
+        self._last_tick = self.device.get_current_tick()
+        self.edge_us    = 0
+
+        # the pin counts edges for as long as it lives, the session only those
+        # since it was last reset
+        self._events_base = 0
+
+        # this is the raw data of flywheel rotation periods, written on its own thread
+        if path is None:
+            path = 'dat/{}.dat'.format(self.time_start.strftime("%Y%m%d%H%M"))
+        self.datfile = session_writer(path, self.time_start, MASS, RADIUS, sync_interval)
+
+        # and the activity, streamed as trackpoints are reached
+        self.activities = activities
+        self.tcx        = tcx_writer(self.tcx_path, self.time_start)
+
+        self.metrics    = telemetry(MASS, RADIUS)
+        self.instrument = instrument
+
+        # course progress tracking
+        self.course = course
+        self.track, self.lap_distance = generate_track(*self.course)
+        self.trackptr   = 0
+        self.lap_count  = 0
+        self.reached    = 0     # trackpoints of the course reached, over all laps
+        self.emit       = emit
+        self.policy     = emission_policy(emit)
+
+    @property
+    def name(self):
+        return self.time_start.strftime("%Y%m%d%H%M")
+
+    @property
+    def tcx_path(self):
+        return os.path.join(self.activities, 'activity_{}.tcx'.format(self.name))
+
+    def start(self, now):
+        # (re)start the elapsed time after a pause, now in monotonic seconds
+        self.time_last = now
+
+    def update(self, now):
+        # returns the x, y course points reached since the last update. now
+        # is monotonic seconds, only used for the elapsed time
+        m              = self.metrics
+        self.dt        = now - self.time_last
+        m.elapsed     += self.dt
+        self.time_last = now
+
+        # every rotation period captured since the last update, possibly several at high rpm
+        count   = self.pin.drain_into(self._ticks, self._periods)
+        periods = memoryview(self._periods)[:count]
+
+        if count:
+            newest = self._ticks[count-1]
+            self.edge_us   += (newest - self._last_tick) & 0xffffffff
+            self._last_tick = newest
+
+        # as above, the dat file gets every one of them
+        self.datfile.write_periods(periods)
+
+        m.push(periods, self.pin._eventcount - self._events_base)
+
+        if self.instrument is not None:
+            # how long ago the newest of these edges happened, on the 32 bit pigpio clock
+            latency = None
+            if count:
+                latency = (self.device.get_current_tick() - self._last_tick) & 0xffffffff
+            self.instrument.drain(count, latency)
+
+        points = []
+        if m.moving:
+            # check progress along the track (course), jumping straight to the
+            # trackpoint reached however far that is from the last one
+            reached = self.track.reached(m.dist, self.lap_distance)
+
+            if reached > self.reached:
+                for tp in range(self.reached, reached):
+                    lap, trackptr = divmod(tp, len(self.track))
+                    points.append(self.track.x[trackptr])
+                    points.append(self.track.y[trackptr])
+
+                    if self.policy.every_trackpoint:
+                        self._emit(trackptr, self.track.dist[trackptr] + lap*self.lap_distance, m.mps)
+
+                # let the trackpointer roll over and update the lap count
+                self.reached = reached
+                self.lap_count, self.trackptr = divmod(reached, len(self.track))
+
+            # otherwise emit where we are whenever the policy says, at the
+            # last point of the course reached
+            if not self.policy.every_trackpoint and self.reached and self.policy.due(self.edge_us, m.dist):
+                self._emit((self.reached - 1) % len(self.track), m.dist, m.mps)
+
+        return points
+
+    def _emit(self, trackptr, dist, speed):
+        # a trackpoint for the activity, timed by the newest edge
+        self.policy.emitted(self.edge_us, dist)
+        self.tcx.write(self.edge_us, self.track.lat[trackptr], self.track.lon[trackptr], dist, speed)
+
+    def reset(self):
+        self.metrics.reset()
+        self.trackptr   = 0
+        self.lap_count  = 0
+        self.reached    = 0
+        self.policy     = emission_policy(self.emit)
+        self.time_start = datetime.now()
+        self._last_tick = self.device.get_current_tick()
+        self.edge_us    = 0
+        self._events_base = self.pin._eventcount
+
+        # start the activity again too
+        self.tcx.abandon()
+        self.tcx = tcx_writer(self.tcx_path, self.time_start)
+
+    def close(self, finalise=True):
+        # exit cleanly by turning off the pin activities and stopping the device
+        self.pin.cancel()
+        self.device.stop()
+        self.datfile.close()
+
+        elapsed = self.metrics.elapsed
+        session = self.name
+
+        # all the activity needs now is its lap summary
+        if int(elapsed) > 0:
+            self.tcx.close(elapsed, self.metrics.dist)
+        else:
+            self.tcx.abandon()
+
+        if self.instrument is not None:
+            self.instrument.dropped = self.pin.dropped
+            if finalise:
+                self.instrument.write(os.path.join(self.activities, '{}.metrics.json'.format(session)))
+            print(self.instrument.text())
+
+        if int(elapsed) > 0:
+
+            total_revs     = self.metrics.eventcount
+            total_distance = self.metrics.dist
+
+            average_speed = total_distance / elapsed
+
+            print("Total distance: {}".format(total_distance))
+            print("Total time: {}".format(hms(elapsed)))
+            print("Average speed: {}".format(average_speed))
+            print("Total revs: {}".format(total_revs))
+            print("Dropped periods: {}".format(self.pin.dropped))
+            print("Dat write latency: {:.1f}ms max, {:.1f}ms mean over {} blocks, queue depth {} max".format(
+                                    1000*self.datfile.latency_max,
+                                    1000*self.datfile.latency_total/max(1, self.datfile.blocks),
+                                    self.datfile.blocks,
+                                    self.datfile.depth_max))
+            print("Lap length: {}".format(self.lap_distance))
+            print("Total laps: {}".format(total_distance/self.lap_distance))
+
+            if finalise:
+                print("File: {}".format(self.tcx_path))
+
+                # -------------------------------------------------------------------------
+                # the session plot is made by a separate process so that we can
+                # leave straight away
+
+                write_pending(session, {'session':    session,
+                                        'elapsed':    int(elapsed),
+                                        'distance':   total_distance,
+                                        'dat':        self.datfile.path,
+                                        'tcx':        self.tcx_path})
+                launch(session)
+
+    def discard(self):
+        # after close, remove the files of a session that isn't to be kept
+        for path in (self.datfile.path, self.tcx_path):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,217 @@
+'''
+// ---------------------------------------------------------------------------
+//
+//                                      ,`\
+//  L                              ...    /  M   M             k
+//  L      ooo   ggg  i  ccc     @ o o @.'   M\ /M  ooo  n nn  k k   ee  y   y
+//  L     o   o g   g . c      .' ( o )      M V M o   o n'  n kk   e__e y   y
+//  L     o   o g   g i c     /  (     )     M   M o   o n   n k k  e    y   y
+//  LLLLL  ooo   gggg i  ccc  \.' \ : /      M   M  ooo  n   n K  k  ee'  yyyy
+//                  g            nnn nnn                                    y
+//                gg                                                     yyy
+//
+// ------------------------------------------------------=--------------------
+//
+// Piyak - a program to monitor and log the effort on a kayak ergo.
+//
+// Copyright (c) 2017-24 Piers Barber   piers.barber@logicmonkey.co.uk
+//
+// ------------------------------------------------------=--------------------
+
+This is free software released under the terms of the MIT licence
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+'''
+Session Store
+
+An SQLite index of every session in dat/: one row of summary figures per
+session, one row per stroke (see postprocess.stroke_table) and one row per
+window length of its mean-maximal power curve (see powercurve.py), so
+questions across years of sessions are a query rather than a rescan of every
+dat file.
+
+update() only processes dat files that are new or have changed size or
+mtime since they were indexed, spread across every core, and removes the
+rows of sessions whose dat file has gone. The main process is the only writer.
+Bump FORMAT when the schema or the figures change and the store is rebuilt
+on its next update.
+
+Times are seconds and powers watts. A session's start is its datestamp as
+'YYYY-MM-DD HH:MM', so SQLite's date functions apply to it directly.
+'''
+
+import os
+import sqlite3
+
+from postprocess import scan_session, STROKE_FIELDS
+from powercurve import durations, mean_maximal
+
+STORE  = 'piyak.db'
+FORMAT = 2                   # bump when the schema or the figures change
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sessions (
+    session    TEXT PRIMARY KEY,
+    path       TEXT NOT NULL,
+    size       INTEGER NOT NULL,
+    mtime_ns   INTEGER NOT NULL,
+    start      TEXT,
+    duration   REAL NOT NULL,
+    strokes    INTEGER NOT NULL,
+    power      REAL,
+    power_a    REAL,
+    power_b    REAL,
+    rate       REAL
+);
+CREATE TABLE IF NOT EXISTS strokes (
+    session        TEXT NOT NULL REFERENCES sessions(session) ON DELETE CASCADE,
+    stroke         INTEGER NOT NULL,
+    side           INTEGER NOT NULL,
+    n1             INTEGER NOT NULL,
+    n2             INTEGER NOT NULL,
+    n3             INTEGER NOT NULL,
+    t1             REAL NOT NULL,
+    t2             REAL NOT NULL,
+    t3             REAL NOT NULL,
+    e1             REAL NOT NULL,
+    e2             REAL NOT NULL,
+    e3             REAL NOT NULL,
+    air_resistance REAL NOT NULL,
+    power          REAL NOT NULL,
+    pull           REAL NOT NULL,
+    PRIMARY KEY (session, stroke)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS power_curve (
+    session TEXT NOT NULL REFERENCES sessions(session) ON DELETE CASCADE,
+    seconds INTEGER NOT NULL,
+    power   REAL NOT NULL,
+    PRIMARY KEY (session, seconds)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sessions_start    ON sessions(start);
+CREATE INDEX IF NOT EXISTS sessions_duration ON sessions(duration);
+CREATE INDEX IF NOT EXISTS sessions_power    ON sessions(power);
+CREATE INDEX IF NOT EXISTS strokes_power     ON strokes(power);
+CREATE INDEX IF NOT EXISTS power_curve_best  ON power_curve(seconds, power);
+'''
+
+# stroke table columns in the order of STROKE_FIELDS
+STROKE_COLUMNS = [name for name, kind in STROKE_FIELDS]
+
+def connect(path=STORE):
+    db = sqlite3.connect(path)
+    db.execute('PRAGMA foreign_keys = ON')
+
+    # a store of another format is rebuilt from scratch
+    if db.execute('PRAGMA user_version').fetchone()[0] != FORMAT:
+        with db:
+            db.execute('DROP TABLE IF EXISTS power_curve')
+            db.execute('DROP TABLE IF EXISTS strokes')
+            db.execute('DROP TABLE IF EXISTS sessions')
+    db.executescript(SCHEMA)
+    db.execute('PRAGMA user_version = {}'.format(FORMAT))
+
+    return db
+
+def session_start(session):
+    # yyyymmddhhmm to 'YYYY-MM-DD HH:MM', None for anything else
+    if len(session) != 12 or not session.isdigit():
+        return None
+    return '{}-{}-{} {}:{}'.format(session[0:4], session[4:6], session[6:8], session[8:10], session[10:12])
+
+def index_session(path, use_cache=True):
+    # the sessions row, the stroke rows and the power curve rows of one dat
+    # file. Runs in a worker
+    # process so everything it returns is plain Python
+    if use_cache:
+        from cache import cached_strokes
+        strokes = cached_strokes(path)
+    else:
+        strokes = scan_session(path)[-1]
+
+    session = os.path.basename(path).replace('.dat', '')
+    stat    = os.stat(path)
+
+    if len(strokes):
+        a = strokes[strokes['side'] == 0]
+        b = strokes[strokes['side'] == 1]
+
+        duration = float(strokes['t3'][-1] - strokes['t1'][0])
+        power    = float(strokes['power'].mean())
+        power_a  = float(a['pull'].mean()) if len(a) else None
+        power_b  = float(b['pull'].mean()) if len(b) else None
+        rate     = 30.0*len(strokes)/duration                   # double strokes/min
+    else:
+        duration, power, power_a, power_b, rate = 0.0, None, None, None, None
+
+    row = (session, path, stat.st_size, stat.st_mtime_ns, session_start(session),
+           duration, len(strokes), power, power_a, power_b, rate)
+
+    curve = [(session, seconds, power) for seconds, power in zip(durations().tolist(), mean_maximal(strokes).tolist())
+             if power == power]                                  # not NaN, a window the session is long enough for
+
+    return row, [(session, n) + stroke for n, stroke in enumerate(strokes.tolist())], curve
+
+def stale(db, paths):
+    # the paths not yet indexed, or changed since they were
+    known = {}
+    for path, size, mtime_ns in db.execute('SELECT path, size, mtime_ns FROM sessions'):
+        known[path] = (size, mtime_ns)
+
+    changed = []
+    for path in paths:
+        stat = os.stat(path)
+        if known.get(path) != (stat.st_size, stat.st_mtime_ns):
+            changed.append(path)
+
+    return changed
+
+def update(db, paths, use_cache=True, workers=None):
+    # bring the store up to date with paths, returns the sessions (re)indexed
+    # and the number removed
+    from concurrent.futures import ProcessPoolExecutor
+
+    paths = [os.path.normpath(path) for path in paths]
+
+    # sessions whose dat file has been deleted, wherever it was
+    with db:
+        gone = [row for row in db.execute('SELECT path FROM sessions') if not os.path.exists(row[0])]
+        db.executemany('DELETE FROM sessions WHERE path = ?', gone)
+
+    changed = stale(db, paths)
+    if not changed:
+        return [], len(gone)
+
+    sessions = []
+    strokes  = 'INSERT INTO strokes (session, stroke, {}) VALUES ({})'.format(
+               ', '.join(STROKE_COLUMNS), ', '.join('?'*(len(STROKE_COLUMNS)+2)))
+
+    with ProcessPoolExecutor(workers) as pool:
+        for row, rows, curve in pool.map(index_session, changed, [use_cache]*len(changed)):
+            # one transaction per session so an interrupted update keeps
+            # everything indexed so far
+            with db:
+                db.execute('DELETE FROM sessions WHERE session = ?', (row[0],))
+                db.execute('INSERT INTO sessions VALUES ({})'.format(', '.join('?'*len(row))), row)
+                db.executemany(strokes, rows)
+                db.executemany('INSERT INTO power_curve VALUES (?, ?, ?)', curve)
+            sessions.append(row[0])
+
+    return sessions, len(gone)
@@ -0,0 +1,187 @@
+'''
+// ---------------------------------------------------------------------------
+//
+//                                      ,`\
+//  L                              ...    /  M   M             k
+//  L      ooo   ggg  i  ccc     @ o o @.'   M\ /M  ooo  n nn  k k   ee  y   y
+//  L     o   o g   g . c      .' ( o )      M V M o   o n'  n kk   e__e y   y
+//  L     o   o g   g i c     /  (     )     M   M o   o n   n k k  e    y   y
+//  LLLLL  ooo   gggg i  ccc  \.' \ : /      M   M  ooo  n   n K  k  ee'  yyyy
+//                  g            nnn nnn                                    y
+//                gg                                                     yyy
+//
+// ------------------------------------------------------=--------------------
+//
+// Piyak - a program to monitor and log the effort on a kayak ergo.
+//
+// Copyright (c) 2017-24 Piers Barber   piers.barber@logicmonkey.co.uk
+//
+// ------------------------------------------------------=--------------------
+
+This is free software released under the terms of the MIT licence
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+'''
+Stroke Engine
+
+The stroke detection and power calculation shared by the live display and
+post-processing. See postprocess.py for the derivation of the maths.
+
+stroke_engine takes one flywheel rotation period at a time and returns a
+stroke_event each time a stroke completes, in constant time and memory per
+period. turning_points() is the same detection over a whole session at once
+for use with NumPy arrays. Both give identical strokes for the same periods.
+'''
+
+import math
+from collections import namedtuple
+
+# numpy is only imported for whole sessions so the live app never loads it
+
+# SI unit for moment of inertia is kg metres squared (not grammes)
+MASS   = 4.360  # mass of Lawler flywheel in kilogrammes (I weighed mine!)
+RADIUS = 0.200  # radius of Lawler flywheel in metres
+
+def ke_constant(mass=MASS, radius=RADIUS):
+    # w  = 2*pi/period (angular velocity omega = 2 pi radians * revolutions/second)
+    # I  = 0.5*m*r^2 (half m radius squared)
+    # KE = 0.5*I*w^2 (half I omega squared)
+    # KE = mass*(radius*pi/period)**2
+    #
+    # with the period in microseconds the constant part is sqrt(m)*r*pi*1e6,
+    # which is 1311967.60918 for the Lawler flywheel
+    return math.sqrt(mass)*radius*math.pi*1.0e6
+
+def rot_ke(periods, mass=MASS, radius=RADIUS):
+    # works on a single period or an array of them. Divide, then square.
+    t = ke_constant(mass, radius)/periods
+    return t*t
+
+def stroke_power(t1, t2, t3, e1, e2, e3):
+    # air resistance is the rate of energy loss from E2 to E3, then
+    # eqs.(1,2) give the power over the whole stroke
+    air_resistance = (e2-e3)/(t3-t2)
+    power = (e2-e1 + air_resistance*(t2-t1)) / (t3-t1)
+    return air_resistance, power
+
+def turning_points(periods):
+    # indices of the alternating local minima and maxima of flywheel energy,
+    # starting with the first minimum. Energy rises as the period falls, so
+    # work on the integer periods and avoid any floating point comparisons.
+    #
+    # A sample is a minimum if the next sample is higher, a maximum if the
+    # next sample is lower. Flat runs belong to whichever trend they are in.
+    import numpy as np
+
+    trend = np.sign(np.diff(-periods))        # +1 rising, -1 falling, 0 flat
+
+    steps = np.flatnonzero(trend)
+    trend = trend[steps]
+
+    rising = np.flatnonzero(trend > 0)
+    if len(rising) == 0:
+        return steps[:0]
+
+    steps = steps[rising[0]:]
+    trend = trend[rising[0]:]
+
+    # a turning point is the first step of each new trend
+    change = np.ones(len(trend), dtype=bool)
+    change[1:] = trend[1:] != trend[:-1]
+
+    return steps[change]
+
+# n1, n2, n3 count the periods pushed, from zero, and strokes alternate
+# between side 0 (A) and side 1 (B)
+stroke_event = namedtuple('stroke_event', 'side n1 n2 n3 t1 t2 t3 e1 e2 e3 air_resistance power')
+
+class stroke_engine:
+    LOOKING_FOR_E1 = 0      # start here in hunt for first local minimum
+    LOOKING_FOR_E2 = 1      # then alternate between this state and the next
+    LOOKING_FOR_E3 = 2
+
+    def __init__(self, mass=MASS, radius=RADIUS):
+        self._ke = ke_constant(mass, radius)
+        self.reset()
+
+    def reset(self):
+        self.count  = 0         # periods pushed
+        self.time   = 0.0       # seconds, the running total of the periods
+        self.period = None      # most recent period pushed
+        self.energy = 0.0       # ...and the flywheel energy it represents
+        self.first  = None      # (t, e) of the first local minimum
+        self.side   = 0
+
+        self._state = self.LOOKING_FOR_E1
+        self._t1 = self._e1 = self._n1 = None
+        self._t2 = self._e2 = self._n2 = None
+
+    def push(self, period):
+        # zero periods carry no information
+        if period == 0:
+            return None
+
+        # a sample is only classified once the next one is known, so
+        # everything below is about the previous sample
+        prev_period = self.period
+        prev_t, prev_e, prev_n = self.time, self.energy, self.count-1
+
+        t = self._ke/period
+        self.energy = t*t
+        self.time  += period*1.0e-6
+        self.period = period
+        self.count += 1
+
+        if prev_period is None:
+            return None
+
+        rising  = prev_period > period
+        falling = prev_period < period
+
+        if self._state == self.LOOKING_FOR_E1:
+            if rising:
+                self._t1, self._e1, self._n1 = prev_t, prev_e, prev_n
+                self.first = (prev_t, prev_e)
+                self._state = self.LOOKING_FOR_E2
+
+        elif self._state == self.LOOKING_FOR_E2:
+            if falling:
+                self._t2, self._e2, self._n2 = prev_t, prev_e, prev_n
+                self._state = self.LOOKING_FOR_E3
+
+        elif rising:
+            # we're at E3 in the data, so calculate the power for this stroke
+            air_resistance, power = stroke_power(self._t1, self._t2, prev_t, self._e1, self._e2, prev_e)
+
+            event = stroke_event(self.side,
+                                 self._n1, self._n2, prev_n,
+                                 self._t1, self._t2, prev_t,
+                                 self._e1, self._e2, prev_e,
+                                 air_resistance, power)
+
+            # e3 is the next e1
+            self._t1, self._e1, self._n1 = prev_t, prev_e, prev_n
+            self._state = self.LOOKING_FOR_E2
+            self.side = 1 - self.side
+
+            return event
+
+        return None
@@ -39,6 +39,27 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 '''
 
+'''
+TCX activity files
+
+The templates for a Garmin Training Center activity with one lap, and
+tcx_writer, which streams trackpoints into one while the session runs.
+
+tcx_writer appends trackpoints in batches on a thread of its own, so the
+SD card never stalls the display. After each batch it rewrites the
+postamble, truncates the file after it and patches the lap summary, whose
+fields are written at a fixed width so they can be overwritten in place.
+The file on disk is a complete, valid activity after every batch, so a
+crash or power cut loses at most one sync_interval of trackpoints, and the
+end of a session only has to patch in the final summary.
+'''
+
+import os
+import time
+import queue
+import threading
+from datetime import timedelta
+
 tcx_preamble = """<?xml version="1.0" encoding="UTF-8"?>
 <TrainingCenterDatabase
   xsi:schemaLocation="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2 http://www.garmin.com/xmlschemas/TrainingCenterDatabasev2.xsd"
@@ -113,3 +134,121 @@ tcx_postamble = """        </Track>
     <PartNumber>000-A0000-00</PartNumber>
   </Author>
 </TrainingCenterDatabase>"""
+
+
+# lap summary fields, zero padded to a fixed width so they patch in place
+SUMMARY = (('TotalTimeSeconds', '{:012.3f}'),
+           ('DistanceMeters',   '{:012.3f}'),
+           ('MaximumSpeed',     '{:08.4f}'),
+           ('Calories',         '{:05d}'))
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+def tcx_time(t):
+    # TCX times are to the millisecond, the Z is in the templates
+    return t.strftime(TIME_FORMAT)[:-3]
+
+def calories(elapsed):
+    return min(65535, int(1000*elapsed/3600))   # crude calc: 1000 calories/hour
+
+class tcx_writer:
+    def __init__(self, path, time_start, sync_interval=10.0, elevation=0, heartrate=150):
+        self.path          = path
+        self.time_start    = time_start
+        self.sync_interval = sync_interval
+        self.elevation     = elevation
+        self.heartrate     = heartrate
+
+        self.count     = 0      # trackpoints written
+        self.elapsed   = 0.0    # seconds, to the latest trackpoint until closed
+        self.distance  = 0.0
+        self.max_speed = 0.0
+
+        start = tcx_time(time_start)
+        head  = tcx_preamble.format(start, start, *[fmt.format(0) for tag, fmt in SUMMARY])
+
+        # where each summary field's value starts in the file
+        self._fields = [(head.index('<{}>'.format(tag)) + len(tag) + 2, fmt) for tag, fmt in SUMMARY]
+
+        self._file = open(path, 'wb')
+        self._file.write(head.encode())
+        self._end  = self._file.tell()    # end of the last trackpoint
+        self._write_batch([])
+
+        self._queue  = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='tcx_writer', daemon=True)
+        self._thread.start()
+
+    def write(self, edge_us, lat, lon, dist, speed):
+        # a trackpoint reached edge_us microseconds into the session
+        self._queue.put((edge_us, lat, lon, dist, speed))
+
+    def _write_batch(self, points):
+        f = self._file
+        f.seek(self._end)
+
+        text = []
+        for edge_us, lat, lon, dist, speed in points:
+            text.append(tcx_trackpoint.format(tcx_time(self.time_start + timedelta(microseconds=edge_us)),
+                                              lat, lon, self.elevation, dist, self.heartrate, speed))
+
+            if (speed > self.max_speed) and (speed < 30):
+                self.max_speed = speed
+            self.elapsed  = edge_us/1e6
+            self.distance = dist
+        self.count += len(points)
+
+        f.write(''.join(text).encode())
+        self._end = f.tell()
+
+        average_speed = self.distance/self.elapsed if self.elapsed > 0 else 0
+        f.write(tcx_postamble.format(average_speed).encode())
+        f.truncate()
+
+        values = (self.elapsed, self.distance, self.max_speed, calories(self.elapsed))
+        for (offset, fmt), value in zip(self._fields, values):
+            f.seek(offset)
+            f.write(fmt.format(value).encode())
+
+        f.flush()
+        os.fsync(f.fileno())
+
+    def _run(self):
+        closing  = None
+        deadline = time.monotonic() + self.sync_interval
+
+        while closing is None:
+            points = []
+
+            # gather everything that arrives before the deadline into one batch
+            while closing is None:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+
+                if item[0] is None:
+                    closing = item
+                else:
+                    points.append(item)
+
+            if points:
+                self._write_batch(points)
+
+            if closing is not None and closing[1] is not None:
+                # the final summary is the whole session's, not the last trackpoint's
+                self.elapsed, self.distance = closing[1], closing[2]
+                self._write_batch([])
+
+            deadline = time.monotonic() + self.sync_interval
+
+    def close(self, elapsed=None, distance=None):
+        # write what is left and patch in the session totals
+        self._queue.put((None, elapsed, distance))
+        self._thread.join()
+        self._file.close()
+
+    def abandon(self):
+        # stop and throw the activity away, e.g. on a reset
+        self.close()
+        os.remove(self.path)
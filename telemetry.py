@@ -0,0 +1,179 @@
+'''
+// ---------------------------------------------------------------------------
+//
+//                                      ,`\
+//  L                              ...    /  M   M             k
+//  L      ooo   ggg  i  ccc     @ o o @.'   M\ /M  ooo  n nn  k k   ee  y   y
+//  L     o   o g   g . c      .' ( o )      M V M o   o n'  n kk   e__e y   y
+//  L     o   o g   g i c     /  (     )     M   M o   o n   n k k  e    y   y
+//  LLLLL  ooo   gggg i  ccc  \.' \ : /      M   M  ooo  n   n K  k  ee'  yyyy
+//                  g            nnn nnn                                    y
+//                gg                                                     yyy
+//
+// ------------------------------------------------------=--------------------
+//
+// Piyak - a program to monitor and log the effort on a kayak ergo.
+//
+// Copyright (c) 2017-24 Piers Barber   piers.barber@logicmonkey.co.uk
+//
+// ------------------------------------------------------=--------------------
+
+This is free software released under the terms of the MIT licence
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+'''
+Telemetry
+
+The numbers shown on the display, kept apart from the display itself so they
+can be worked out and checked without Kivy.
+
+telemetry takes the flywheel periods captured since the last update and
+keeps the power, stroke rate, speed and distance. refresher pushes one of
+those numbers to a widget, formatting it no more often than its refresh
+rate and only setting the widget when the text actually changes: every
+assignment to a Kivy label re-renders its texture, so an unchanged value
+must cost nothing. ease() moves the needle smoothly between period samples,
+which only arrive once per flywheel revolution.
+'''
+
+import math
+from collections import deque
+
+from strokes import stroke_engine, MASS, RADIUS
+
+# widget refresh rates in Hz
+REFRESH = {'elapsed': 2,    # twice a second so the seconds never skip
+           'speed':   10,
+           'dist':    4,
+           'power':   4,
+           'stroke':  4,
+           'needle':  60,
+           'overlay': 2}    # instrumentation, only with PIYAK_METRICS set
+
+NEEDLE_LAG = 0.08   # time constant of the needle in seconds
+
+METRES_PER_REV = 0.2444444444   # 11km/h = 750rpm => 1 rev = 11000/(60*750) metres
+
+def hms(elapsed):
+    # elapsed seconds as hh:mm:ss
+    hour, remr = divmod(int(elapsed), 60*60)
+    mins, secs = divmod(remr, 60)
+    return "{:02d}:{:02d}:{:02d}".format(hour, mins, secs)
+
+def ease(shown, target, dt, lag=NEEDLE_LAG):
+    # first order lag towards the target, independent of the frame rate
+    return target + (shown - target)*math.exp(-dt/lag)
+
+class telemetry:
+
+    # session metrics from flywheel periods, no display code in here
+
+    def __init__(self, mass=MASS, radius=RADIUS, samples=4):
+        self.engine  = stroke_engine(mass, radius)
+        self.samples = samples
+        self.reset()
+
+    def reset(self):
+        self.engine.reset()
+        self.elapsed     = 0.0     # seconds
+        self.eventcount  = 0
+        self.energy_samp = deque([0]*self.samples, self.samples)
+        self.stroke_samp = deque([0]*self.samples, self.samples)
+        self.rate_samp   = deque([0]*self.samples, self.samples)
+
+        self.power  = 0.0   # watts, averaged over the last few strokes
+        self.spm    = 0.0   # double strokes per minute
+        self.hrpm   = 0.0   # hundreds of rpm
+        self.kph    = 0.0
+        self.mps    = 0.0
+        self.dist   = 0.0   # metres
+        self.moving = False
+
+    @property
+    def needle(self):
+        return -22.5 * self.hrpm
+
+    def push(self, periods, eventcount):
+        # returns the number of strokes completed by these periods
+        strokes = 0
+        for period in periods:
+            stroke = self.engine.push(period)
+
+            if stroke is not None:
+                # average power and stroke rate over the last few strokes
+                stroke_period = stroke.t3 - stroke.t1
+
+                self.energy_samp.append(stroke.power * stroke_period)
+                self.stroke_samp.append(stroke_period)
+
+                self.rate_samp.append(30.0/stroke_period)
+                strokes += 1
+
+        if strokes:
+            self.power = sum(self.energy_samp)/sum(self.stroke_samp)
+            self.spm   = sum(self.rate_samp)/self.rate_samp.maxlen
+
+        self.eventcount = eventcount
+        self.moving     = self.engine.period is not None and eventcount != 0
+
+        if self.moving:
+            period = self.engine.period
+
+            # the GPIO pin timer clock is 1MHz <=> 1us period
+            # count hundreds of rpm, i.e. hrpm = 60*1E6/(100*delta)
+            self.hrpm = 600000.0 / period
+            # using 750rpm = 11km/h as a model, km/h = rpm * 11/750
+            # then kph = 60*1E6/delta * 11/750 = 880000/delta
+            self.kph  = 880000.0 / period
+            # TCX files seem to like speed in m/s, so calculate that
+            self.mps  = 244444.4 / period     # kph x 1000/(60*60)
+            self.dist = eventcount * METRES_PER_REV
+
+        return strokes
+
+class refresher:
+
+    # sets widget.name to fmt(value) at most rate times a second, and only on change
+
+    def __init__(self, widget, name, fmt, rate):
+        self.widget   = widget
+        self.name     = name
+        self.fmt      = fmt
+        self.interval = 1.0/rate
+        self.reset()
+
+    def reset(self):
+        # call after setting the widget directly
+        self.shown = getattr(self.widget, self.name)
+        self.due   = 0.0
+
+    def update(self, now, value):
+        if now < self.due:
+            return False
+        self.due = now + self.interval
+
+        shown = self.fmt(value)
+        if shown == self.shown:
+            return False
+
+        setattr(self.widget, self.name, shown)
+        self.shown = shown
+        return True
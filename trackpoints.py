@@ -0,0 +1,90 @@
+'''
+// ---------------------------------------------------------------------------
+//
+//                                      ,`\
+//  L                              ...    /  M   M             k
+//  L      ooo   ggg  i  ccc     @ o o @.'   M\ /M  ooo  n nn  k k   ee  y   y
+//  L     o   o g   g . c      .' ( o )      M V M o   o n'  n kk   e__e y   y
+//  L     o   o g   g i c     /  (     )     M   M o   o n   n k k  e    y   y
+//  LLLLL  ooo   gggg i  ccc  \.' \ : /      M   M  ooo  n   n K  k  ee'  yyyy
+//                  g            nnn nnn                                    y
+//                gg                                                     yyy
+//
+// ------------------------------------------------------=--------------------
+//
+// Piyak - a program to monitor and log the effort on a kayak ergo.
+//
+// Copyright (c) 2017-24 Piers Barber   piers.barber@logicmonkey.co.uk
+//
+// ------------------------------------------------------=--------------------
+
+This is free software released under the terms of the MIT licence
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+'''
+Trackpoint Emission
+
+How often a trackpoint of the session is sent to the activity file is the
+emission policy, given as
+  'trackpoint'  every point of the course reached (the default)
+  '<N>s'        at most one every N seconds
+  '<N>m'        at most one every N metres
+so a very long session can be kept to a bounded number of points. Only the
+time and distance of the last trackpoint emitted are kept here; the
+trackpoints themselves go straight to the activity (see tcx.py).
+'''
+
+def emission(policy):
+    # 'trackpoint', '5s' or '20m' as (mode, every)
+    if policy == 'trackpoint':
+        return 'trackpoint', None
+    if policy[-1:] in ('s', 'm'):
+        try:
+            every = float(policy[:-1])
+        except ValueError:
+            every = 0
+        if every > 0:
+            return {'s': 'seconds', 'm': 'metres'}[policy[-1]], every
+    raise ValueError("emission policy must be 'trackpoint', '<N>s' or '<N>m', not {!r}".format(policy))
+
+class emission_policy:
+    def __init__(self, policy='trackpoint'):
+        self.policy      = policy
+        self.mode, every = emission(policy)
+        self.every_trackpoint = self.mode == 'trackpoint'
+        self._every      = every * 1e6 if self.mode == 'seconds' else every
+
+        self.count   = 0        # trackpoints emitted
+        self.edge_us = None     # microseconds from the start of the session, of the last one
+        self.dist    = None     # metres, of the last one
+
+    def due(self, edge_us, dist):
+        # for the seconds and metres policies, is a trackpoint due now?
+        if not self.count:
+            return True
+        if self.mode == 'seconds':
+            return edge_us - self.edge_us >= self._every
+        return dist - self.dist >= self._every
+
+    def emitted(self, edge_us, dist):
+        self.count  += 1
+        self.edge_us = edge_us
+        self.dist    = dist